@@ -0,0 +1,91 @@
+'''
+Benchmark for the deadlines, retries and hedging of the algolia client
+
+Local stand-in servers play the algolia hosts: the first one is fast, but sometimes very slow,
+the second one is a bit slower and the third one fails. The tail latency is compared with and
+without hedging.
+
+Run with `python -m benchmarks.algolia_hedging`
+'''
+
+import asyncio
+import random
+import time
+
+from aiohttp import web
+
+from utils.hedged import HedgedClient
+from utils.http import HttpStats, LatencyHistogram, create_session
+
+REQUESTS = 300
+PORT = 8790
+# (usual latency, chance of a slow answer, slow latency, failing)
+HOSTS = ((0.02, 0.08, 1.5, False), (0.04, 0.0, 0, False), (0.01, 0.0, 0,
+                                                             True))
+
+
+def create_host(latency: float, slow_chance: float, slow: float,
+                failing: bool) -> web.Application:
+
+    async def query(request: web.Request) -> web.Response:
+        await request.json()
+        if failing:
+            return web.Response(status=503)
+
+        await asyncio.sleep(slow if random.random() < slow_chance else latency)
+        return web.json_response({'hits': []})
+
+    app = web.Application()
+    app.router.add_post('/1/indexes/{index}/query', query)
+    return app
+
+
+async def run():
+    random.seed(0)
+    runners = []
+    for i, host in enumerate(HOSTS):
+        runner = web.AppRunner(create_host(*host))
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', PORT + i).start()
+        runners.append(runner)
+
+    session = create_session(HttpStats())
+    urls = [f'http://127.0.0.1:{PORT + i}' for i in range(len(HOSTS))]
+
+    for name, hosts, hedge in (
+        ('no hedging', urls[:2], False),
+        ('hedging', urls[:2], True),
+        ('failing first host', [urls[2], urls[1]], True),
+    ):
+        client = HedgedClient(lambda: session,
+                              hosts,
+                              deadline=1,
+                              hedge=hedge)
+        # every request is measured, including the ones over the deadline
+        latency = LatencyHistogram()
+        for _ in range(REQUESTS):
+            start = time.perf_counter()
+            try:
+                await client.post('/1/indexes/wiki/query', {'query': 'a'})
+            except asyncio.TimeoutError:
+                pass
+            latency.observe(time.perf_counter() - start)
+
+        stats = client.stats
+        print(f'{name}:\n  {str(latency).splitlines()[0]}\n'
+              f'  retries: {stats.retries}, hedges: {stats.hedges} '
+              f'({stats.hedge_wins} won), '
+              f'deadline exceeded: {stats.deadline_exceeded}\n'
+              f'  abandoned attempts: {stats.abandoned_latency.total}')
+
+    await session.close()
+    for runner in runners:
+        await runner.cleanup()
+
+
+def main():
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+'''
+Benchmark for the match engines of the auto-answer
+
+Compares the latency of the fuzzy cascade and bm25, how often they give the same answer
+and how often they answer with the entry the message was taken from.
+Messages are titles with typos, excerpts of descriptions, questions with the key words of a title
+between filler words, and unrelated messages.
+
+Run with `python -m benchmarks.faq_engines`
+'''
+
+import random
+import string
+import time
+
+from classes.faq import FaqEntry
+from utils.faq import FaqSnapshot, FaqUtil
+from utils.matcher import match_message
+
+ENTRIES = 2000
+QUERIES = 300
+# words of real questions, which are not in the faq
+QUESTION_STARTS = ('how can i fix', 'why does', 'what is wrong with',
+                   'is there a way to use', 'anyone know about')
+QUESTION_ENDS = ('please help', 'any ideas', 'thanks', 'i am stuck', '')
+CHATTER = ('what is the weather like today', 'good morning everyone',
+           'thanks for the help with that', 'anyone here playing tonight',
+           'i think the update is great')
+
+
+def random_word() -> str:
+    return ''.join(
+        random.choices(string.ascii_lowercase, k=random.randint(2, 9)))
+
+
+def typo(text: str) -> str:
+    i = random.randrange(len(text))
+    return text[:i] + random.choice(string.ascii_lowercase) + text[i + 1:]
+
+
+def create_corpus() -> tuple[FaqSnapshot, list[str], list[str | None]]:
+    '''
+    Creates a random faq and messages asking about it
+
+    :return: The faq, the messages and the tag of the entry every message was taken from (None for unrelated messages)
+    :rtype: tuple[FaqSnapshot, list[str], list[str | None]]
+    '''
+    random.seed(0)
+    words = [random_word() for _ in range(5000)]
+    # a few very common words, like in real questions
+    common = ['how', 'do', 'i', 'the', 'a', 'to', 'with', 'in', 'my']
+
+    def sentence(length: int) -> str:
+        return ' '.join(
+            random.choice(common) if random.random() < 0.3 else random.
+            choice(words) for _ in range(length))
+
+    data = [
+        FaqEntry(tags=[f'tag{i}', random_word()],
+                 title=sentence(random.randint(3, 8)),
+                 description=sentence(random.randint(20, 200)))
+        for i in range(ENTRIES)
+    ]
+    faq = FaqUtil('benchmark.json', data)
+    snapshot = faq.snapshot()
+
+    queries: list[str] = []
+    expected: list[str | None] = []
+    for _ in range(QUERIES):
+        entry = random.choice(data)
+        kind = random.random()
+        if kind < 0.3:
+            query = typo(entry.title)
+        elif kind < 0.55:
+            words_ = entry.description.split()  # type: ignore
+            start = random.randrange(max(1, len(words_) - 8))
+            query = ' '.join(words_[start:start + 8])
+        elif kind < 0.8:
+            # a question with the key words of the title between filler words
+            key_words = [w for w in entry.title.split() if w not in common]
+            query = ' '.join(
+                (random.choice(QUESTION_STARTS), *key_words[:3],
+                 random.choice(QUESTION_ENDS))).strip()
+        elif kind < 0.9:
+            query = sentence(6)
+            entry = None
+        else:
+            query = random.choice(CHATTER)
+            entry = None
+        queries.append(f'?{query}')
+        expected.append(entry.tags[0] if entry else None)
+
+    return snapshot, queries, expected
+
+
+def main():
+    snapshot, queries, expected = create_corpus()
+
+    # build the bm25 indices before measuring
+    snapshot.title_bm25, snapshot.description_bm25
+
+    results: dict[str, list[str | None]] = {}
+    for engine in ('fuzzy', 'bm25'):
+        start = time.perf_counter()
+        results[engine] = [
+            match_message(snapshot, q, engine=engine) for q in queries
+        ]
+        seconds = (time.perf_counter() - start) / len(queries)
+        answered = sum(r is not None for r in results[engine])
+        correct = sum(r == e for r, e in zip(results[engine], expected))
+        print(f'{engine:<8}{seconds * 1000:>8.3f} ms/message  '
+              f'{answered}/{len(queries)} answered  '
+              f'{correct}/{len(queries)} correct')
+
+    agreement = sum(a == b for a, b in zip(results['fuzzy'], results['bm25']))
+    print(f'agreement: {agreement}/{len(queries)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+'''
+Benchmark for looking up faq entries by their tags
+
+Run with `python -m benchmarks.faq_lookup`
+'''
+
+import random
+import string
+import time
+import timeit
+
+from classes.faq import FaqEntry
+from utils.faq import FaqUtil
+
+ENTRIES = 5000
+TAGS_PER_ENTRY = 3
+
+
+def random_tag() -> str:
+    return ''.join(random.choices(string.ascii_lowercase, k=12))
+
+
+def linear_get_faq(data: list[FaqEntry], tag: str) -> FaqEntry | None:
+    '''The lookup before the tag index existed'''
+    for entry in data:
+        if tag in entry.tags:
+            return entry
+
+
+def linear_conflict(all_tags: list[str], tags: list[str]) -> bool:
+    '''The conflict check before the tag index existed (against the cached tag list)'''
+    return any(tag in all_tags for tag in tags)
+
+
+def main():
+    random.seed(0)
+    data = [
+        FaqEntry(tags=[random_tag() for _ in range(TAGS_PER_ENTRY)],
+                 title=f'Entry {i}') for i in range(ENTRIES)
+    ]
+    faq = FaqUtil('benchmark.json', data)
+
+    tags = [t for e in data for t in e.tags]
+    lookups = random.choices(tags, k=200)
+    new_tags = [random_tag() for _ in range(5)]
+
+    print(f'{len(tags)} tags')
+
+    def bench(name: str, func, number: int = 5):
+        seconds = min(timeit.repeat(func, number=number, repeat=3)) / number
+        print(f'{name:<32}{seconds * 1000:>10.3f} ms')
+
+    bench('get_faq x200 (linear)',
+          lambda: [linear_get_faq(data, t) for t in lookups])
+    bench('get_faq x200 (index)', lambda: [faq.get_faq(t) for t in lookups])
+
+    all_tags = sorted(tags)
+    bench('conflict check (linear)',
+          lambda: linear_conflict(all_tags, new_tags))
+    bench('conflict check (index)',
+          lambda: any(faq.get_faq(t) is not None for t in new_tags))
+
+    # entries are removed once, so every removal gets a fresh copy of the faq
+    removed = random.sample(range(ENTRIES), 200)
+
+    copy = list(data)
+    start = time.perf_counter()
+    for i in removed:
+        copy.remove(data[i])
+    print(f'{"remove x200 (list.remove)":<32}'
+          f'{(time.perf_counter() - start) * 1000:>10.3f} ms')
+
+    faq = FaqUtil('benchmark.json', list(data))
+    start = time.perf_counter()
+    for i in removed:
+        faq._delete_entry(data[i])
+    print(f'{"remove x200 (index)":<32}'
+          f'{(time.perf_counter() - start) * 1000:>10.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
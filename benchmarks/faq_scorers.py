@@ -0,0 +1,50 @@
+'''
+Benchmark for the scorer backends of the fuzzy matching
+
+Every backend scores the same corpus as `benchmarks.faq_engines`, once with the n-gram candidates
+like the auto-answer does and once against every tag, title and description of the faq.
+
+Run with `python -m benchmarks.faq_scorers`
+'''
+
+import time
+
+from benchmarks.faq_engines import create_corpus
+from utils.matcher import match_message
+from utils.scorer import SCORERS
+from utils.text import normalize
+
+# messages scored against the whole faq, which is a lot slower than with candidates
+FULL_QUERIES = 20
+
+
+def main():
+    snapshot, queries, expected = create_corpus()
+    tiers = (snapshot.normalized_tags, snapshot.title_index.normalized(),
+             snapshot.description_index.normalized())
+    print(f'{sum(len(t) for t in tiers)} texts, {len(queries)} messages')
+
+    results: dict[str, list[str | None]] = {}
+    for name, scorer in SCORERS.items():
+        start = time.perf_counter()
+        results[name] = [
+            match_message(snapshot, q, scorer=name) for q in queries
+        ]
+        seconds = (time.perf_counter() - start) / len(queries)
+
+        start = time.perf_counter()
+        for query in queries[:FULL_QUERIES]:
+            list(scorer.extract_cascade(normalize(query), tiers, 5))
+        full_seconds = (time.perf_counter() - start) / FULL_QUERIES
+
+        correct = sum(r == e for r, e in zip(results[name], expected))
+        agreement = sum(
+            a == b for a, b in zip(results[name], results['thefuzz']))
+        print(f'{name:<10}{seconds * 1000:>8.3f} ms/message  '
+              f'{full_seconds * 1000:>9.3f} ms/message (whole faq)  '
+              f'{correct}/{len(queries)} correct  '
+              f'{agreement}/{len(queries)} same as thefuzz')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+'''
+Benchmark for extracting the open graph metadata of wiki pages
+
+Compares the full BeautifulSoup parse, which was used before, with the head-only extractor
+on generated pages of the size of real wiki pages.
+
+Run with `python -m benchmarks.og_extract`
+'''
+
+import asyncio
+import random
+import string
+import timeit
+from typing import AsyncIterator
+
+from utils.og import OG_FIELDS, parse_og, read_og
+
+# size of the body of a small, a typical and a long wiki page
+BODY_SIZES = (20_000, 120_000, 600_000)
+CHUNK_SIZE = 8192
+
+
+def random_text(length: int) -> str:
+    return ''.join(random.choices(string.ascii_lowercase + ' ', k=length))
+
+
+def create_page(body_size: int) -> bytes:
+    head = ['<meta charset="utf-8">', '<title>Page | Bedrock Wiki</title>']
+    head += [f'<link rel="preload" href="/assets/{i}.js" as="script">'
+             for i in range(30)]
+    head += [
+        f'<meta name="{field}" content="{random_text(60)}">'
+        for field in OG_FIELDS
+    ]
+    head += [f'<script type="module" src="/assets/{i}.js"></script>'
+             for i in range(10)]
+
+    body: list[str] = []
+    size = 0
+    while size < body_size:
+        block = (f'<h2 id="h{size}">{random_text(30)}</h2>'
+                 f'<p>{random_text(400)} <code>{random_text(20)}</code></p>'
+                 f'<div class="language-json"><pre><code>{random_text(300)}'
+                 '</code></pre></div>')
+        body.append(block)
+        size += len(block)
+
+    return (f'<!DOCTYPE html><html lang="en"><head>{"".join(head)}</head>'
+            f'<body><div id="app">{"".join(body)}</div></body></html>'
+            ).encode('utf-8')
+
+
+def soup_og(html: bytes) -> tuple[str, ...]:
+    '''The extraction before the head-only extractor existed'''
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+    return tuple(
+        soup.find('meta', attrs={
+            'name': field
+        }).get('content')  # type: ignore
+        for field in OG_FIELDS)
+
+
+async def chunks(html: bytes) -> AsyncIterator[bytes]:
+    for i in range(0, len(html), CHUNK_SIZE):
+        yield html[i:i + CHUNK_SIZE]
+
+
+def main():
+    random.seed(0)
+
+    try:
+        import bs4  # noqa: F401
+        has_soup = True
+    except ImportError:
+        # beautifulsoup is no dependency of the bot anymore
+        print('beautifulsoup4 is not installed, skipping the full parse')
+        has_soup = False
+
+    def bench(name: str, func, number: int = 5):
+        seconds = min(timeit.repeat(func, number=number, repeat=3)) / number
+        print(f'  {name:<28}{seconds * 1000:>10.3f} ms')
+
+    for body_size in BODY_SIZES:
+        html = create_page(body_size)
+        fields, read = asyncio.run(read_og(chunks(html)))
+        assert tuple(fields[f] for f in OG_FIELDS) == tuple(
+            parse_og(html)[f] for f in OG_FIELDS)
+
+        print(f'{len(html) // 1000} kB page ({read // 1000} kB read when streaming)')
+        if has_soup:
+            bench('BeautifulSoup, 6 finds', lambda: soup_og(html))
+        bench('head-only, whole page', lambda: parse_og(html))
+        bench('head-only, streamed',
+              lambda: asyncio.run(read_og(chunks(html))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+'''
+Benchmark for the local wiki mirror against a fake algolia server
+
+The fake server answers the browse and query api with generated wiki records and a fixed latency.
+The mirror is synced from it, then searches are answered by the mirror, by algolia and by the
+mirror as a fallback while the server fails.
+
+Run with `python -m benchmarks.wiki_mirror`
+'''
+
+import asyncio
+import os
+import random
+import string
+import tempfile
+import time
+
+from aiohttp import web
+
+from utils.algolia import AlgoliaUtil
+from utils.wiki_mirror import WikiMirror
+
+RECORDS = 5000
+PAGE_SIZE = 1000
+LATENCY = 0.05
+QUERIES = 200
+PORT = 8780
+
+
+def random_word() -> str:
+    return ''.join(
+        random.choices(string.ascii_lowercase, k=random.randint(3, 9)))
+
+
+def create_hits() -> list[dict]:
+    words = [random_word() for _ in range(2000)]
+    hits = []
+    for i in range(RECORDS):
+        page = i // 20
+        kind = random.choice(('lvl1', 'lvl2', 'content'))
+        hits.append({
+            'objectID': str(i),
+            'type': kind,
+            'url': f'https://wiki.bedrock.dev/page-{page}#{i}',
+            'hierarchy': {
+                'lvl0': 'Documentation',
+                'lvl1': ' '.join(random.choices(words, k=3)),
+                'lvl2': ' '.join(random.choices(words, k=4)),
+            },
+            'content': ' '.join(random.choices(words, k=40)),
+        })
+    return hits
+
+
+def create_fake_algolia(hits: list[dict], state: dict) -> web.Application:
+
+    async def browse(request: web.Request) -> web.Response:
+        body = await request.json()
+        start = int(body.get('cursor', 0))
+        end = start + PAGE_SIZE
+        page = {'hits': hits[start:end]}
+        if end < len(hits):
+            page['cursor'] = str(end)
+        return web.json_response(page)
+
+    async def query(request: web.Request) -> web.Response:
+        await asyncio.sleep(LATENCY)
+        if state['down']:
+            return web.Response(status=503)
+
+        body = await request.json()
+        words = body['query'].split()
+        found = [
+            h for h in hits
+            if any(w in h['content'] or w in h['hierarchy']['lvl1']
+                   for w in words)
+        ][:body['hitsPerPage']]
+
+        def snippet(text: str) -> dict:
+            return {'value': text, 'matchedWords': words}
+
+        return web.json_response({
+            'hits': [{
+                **h, '_snippetResult': {
+                    'hierarchy': {
+                        k: snippet(v)
+                        for k, v in h['hierarchy'].items()
+                    },
+                    'content': snippet(h['content'])
+                },
+                '_highlightResult': {
+                    'hierarchy': {
+                        k: snippet(v)
+                        for k, v in h['hierarchy'].items()
+                    },
+                    'content': snippet(h['content'])
+                }
+            } for h in found]
+        })
+
+    app = web.Application()
+    app.router.add_post('/1/indexes/{index}/browse', browse)
+    app.router.add_post('/1/indexes/{index}/query', query)
+    return app
+
+
+async def run():
+    random.seed(0)
+    hits = create_hits()
+    state = {'down': False}
+
+    runner = web.AppRunner(create_fake_algolia(hits, state))
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', PORT).start()
+
+    path = os.path.join(tempfile.mkdtemp(), 'wiki_mirror.json')
+    mirror = await WikiMirror.create(path)
+    algolia = AlgoliaUtil('app',
+                          'key',
+                          'index',
+                          cache_size=0,
+                          mirror=mirror,
+                          hosts=[f'http://127.0.0.1:{PORT}'])
+
+    start = time.perf_counter()
+    records = await algolia.sync_mirror()
+    print(f'synced {records} records in '
+          f'{time.perf_counter() - start:.2f} s')
+
+    queries = [
+        ' '.join(random.choice(hits)['content'].split()[:2])
+        for _ in range(QUERIES)
+    ]
+
+    async def bench(name: str, queries: list[str] = queries):
+        start = time.perf_counter()
+        requests = algolia.client.stats.requests
+        answered = 0
+        for query in queries:
+            answered += bool(await algolia.search_query(query))
+        seconds = (time.perf_counter() - start) / len(queries)
+        print(f'{name:<24}{seconds * 1000:>8.3f} ms/search  '
+              f'{answered}/{len(queries)} answered  '
+              f'{algolia.client.stats.requests - requests} sent to algolia')
+
+    await bench('mirror')
+
+    # questions with a word, which is not in the wiki, are left to algolia
+    await bench('mirror, unknown word', [
+        f'how do i use {query.split()[0]} with {random_word()}q'
+        for query in queries
+    ])
+
+    # an outdated mirror is only used if algolia fails
+    mirror.max_age = 0
+    await bench('algolia')
+
+    state['down'] = True
+    await bench('mirror as fallback')
+    print(f'fallbacks: {algolia.fallbacks}')
+
+    await algolia.close()
+    await runner.cleanup()
+
+
+def main():
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
@@ -14,3 +14,24 @@ class AlgoliaResult:
     highlight: list[str]
     url: str
     type: AlgoliaResultType
+
+
+@dataclass
+class CachedMetadata:
+    # title, description, image, image alt text, site name and full url
+    metadata: list[str]
+    etag: str | None = None
+    last_modified: str | None = None
+    # unix time of the last download or revalidation
+    checked: float = 0
+
+
+@dataclass
+class WikiRecord:
+    # the algolia record type (lvl1, lvl2 or content)
+    type: str
+    url: str
+    lvl0: str | None = None
+    lvl1: str | None = None
+    lvl2: str | None = None
+    content: str | None = None
@@ -8,3 +8,25 @@ class Config:
     algolia_app_id: str
     algolia_auth_key: str
     algolia_index_name: str
+    faq_match_mode: str = 'thread'
+    faq_match_workers: int = 2
+    faq_match_timeout: float = 2
+    faq_answer_ttl: int = 120
+    faq_embed_cache_size: int = 256
+    faq_unmatched_ttl: int = 300
+    faq_storage: str = 'json'
+    faq_match_engine: str = 'fuzzy'
+    faq_match_scorer: str = 'thefuzz'
+    algolia_cache_size: int = 256
+    algolia_cache_ttl: int = 600
+    algolia_cache_stale_ttl: int = 3600
+    metadata_cache_size: int = 512
+    metadata_cache_ttl: int = 3600
+    metadata_prefetch: int = 2
+    search_session_ttl: int = 900
+    search_session_size: int = 1000
+    search_session_bytes: int = 1000000
+    algolia_mirror_interval: int = 0
+    algolia_mirror_max_age: int = 86400
+    algolia_deadline: float = 2.5
+    algolia_hedge: bool = True
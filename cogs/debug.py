@@ -2,6 +2,7 @@ import discord
 from discord.ext import commands
 
 from main import ids
+from utils.persistence import writer
 
 
 class Debug(commands.Cog):
@@ -9,6 +10,14 @@ class Debug(commands.Cog):
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
 
+    def get_stats(self) -> dict[str, str]:
+        '''Gets the statistics of this cog, which are displayed by `/stats`'''
+        return {
+            'Persistence':
+            f'scheduled writes: {writer.scheduled}\n'
+            f'coalesced writes: {writer.written}',
+        }
+
     @commands.Cog.listener()
     async def on_ready(self):
         print(
@@ -25,6 +34,27 @@ class Debug(commands.Cog):
         '''Measures the ping of the bot'''
         await ctx.respond(f'The bots latency is: {self.bot.latency * 1000} ms')
 
+    @commands.slash_command(guild_ids=ids.servers)
+    @discord.guild_only()
+    @discord.default_permissions(manage_messages=True)
+    @commands.has_any_role(*ids.roles.admin)
+    async def stats(self, ctx: discord.ApplicationContext):
+        '''Shows the statistics of all cogs'''
+        embed = discord.Embed(title='Statistics',
+                              color=discord.Color.blurple())
+
+        # every cog can provide its statistics with a `get_stats` method
+        for cog in self.bot.cogs.values():
+            if not hasattr(cog, 'get_stats'):
+                continue
+
+            for name, value in cog.get_stats().items():  # type: ignore
+                embed.add_field(name=f'{cog.qualified_name}: {name}',
+                                value=f'```{value}```',
+                                inline=False)
+
+        await ctx.respond(embed=embed, ephemeral=True)
+
 
 def setup(bot: commands.Bot):
     bot.add_cog(Debug(bot))
@@ -3,13 +3,25 @@ import math
 
 import discord
 from discord.ext import commands, pages
-from thefuzz import fuzz, process
 
+from classes.faq import FaqEntry
 from components.faq import AddFaqModal, EditFaqModal
 from main import ids
+from utils.cache import TTLCache
+from utils.autocomplete import TagAutocomplete
+from utils.config import ConfigUtil
 from utils.faq import FaqUtil
+from utils.matcher import FaqMatcher
 from utils.tabulate import tabulate
-from utils.variables import Texts
+from utils.variables import Consts, Texts
+
+# shared by all answers for unknown tags
+NOT_FOUND_EMBED = discord.Embed(
+    title='Tag not found',
+    description=
+    'Could not find your tag. If you made a typo, use the autocomplete feature to find the correct tag!',
+    color=discord.Color.red(),
+)
 
 
 class Faq(commands.Cog):
@@ -17,50 +29,85 @@ class Faq(commands.Cog):
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
 
-    def _get_tags_autocomplete(self, ctx: discord.AutocompleteContext):
-        # return all tags list if value is ''
-        if ctx.value == '':
-            return self.data.get_all_tags(-1)
-
-        # return the nearest tags, which are calculated by thefuzz
-        res = process.extract(
-            ctx.value.lower(),
-            self.data.get_all_tags(-1),
-            limit=10,
-            scorer=fuzz.WRatio,
-        )
-
-        return [tag[0] for tag in res if tag[1] >= 50]
+    def cog_unload(self):
+        self.matcher.close()
+
+    def get_stats(self) -> dict[str, str]:
+        '''Gets the statistics of this cog, which are displayed by `/stats`'''
+        stats = self.matcher.stats
+        return {
+            'Matcher':
+            f'mode: {self.matcher.mode}\n'
+            f'engine: {self.matcher.engine}\n'
+            f'calls: {stats.calls}\n'
+            f'timeouts: {stats.timeouts}\n'
+            f'loop time: {stats.loop_seconds * 1000:.1f} ms\n'
+            f'loop time saved: {stats.worker_seconds * 1000:.1f} ms\n'
+            f'slowest call: {stats.max_seconds * 1000:.1f} ms',
+            'Caches':
+            f'recent answers: {len(self.recent_answers)} '
+            f'({self.recent_answers.hits} collapsed)\n'
+            f'unmatched messages: {len(self.matcher.unmatched)} '
+            f'({self.matcher.unmatched.hits} skipped)',
+            'Autocomplete':
+            f'memoized: {len(self.autocomplete.memo)}\n'
+            f'hits: {self.autocomplete.hits}\n'
+            f'misses: {self.autocomplete.misses}\n'
+            f'narrowed by previous keystroke: {self.autocomplete.narrowed}',
+            'Embeds':
+            f'cached: {len(self.embeds)}\n'
+            f'hits: {self.embeds.hits}\n'
+            f'misses: {self.embeds.misses}',
+        }
+
+    async def _get_tags_autocomplete(self, ctx: discord.AutocompleteContext):
+        # return the tags starting with the value, then the nearest tags
+        return await self.autocomplete.complete(ctx.value)
 
     def _create_faq_embed(self, tag: str) -> discord.Embed:
+        '''
+        Gets the embed of a faq, which is only built once per version of the entry
+
+        The embed is shared by all answers with the same tag, so it must not be changed.
+
+        :param tag: The tag of the faq
+        :type tag: str
+        :return: The embed of the faq or `NOT_FOUND_EMBED`
+        :rtype: discord.Embed
+        '''
         # get faq
         faq = self.data.get_faq(tag)
 
         if faq is None:
-            embed = discord.Embed(
-                title='Tag not found',
-                description=
-                'Could not find your tag. If you made a typo, use the autocomplete feature to find the correct tag!',
-                color=discord.Color.red(),
-            )
-        else:
-            # create embed
-            embed = discord.Embed(
-                title=faq.title,
-                description=faq.description,
-                color=discord.Color.blurple(),
-            )
-            embed.set_thumbnail(url=img if (img := faq.image) else '')
-            if (faq.modification_time != 0):
-                embed.timestamp = datetime.datetime.fromtimestamp(
-                    faq.modification_time)
-                embed.set_footer(text="Last updated:")
+            return NOT_FOUND_EMBED
+
+        key = (tag.lower(), faq.modification_time)
+        if (embed := self.embeds.get(key)) is not None:
+            return embed
+
+        # create embed
+        embed = discord.Embed(
+            title=faq.title,
+            description=faq.description,
+            color=discord.Color.blurple(),
+        )
+        embed.set_thumbnail(url=img if (img := faq.image) else '')
+        if (faq.modification_time != 0):
+            embed.timestamp = datetime.datetime.fromtimestamp(
+                faq.modification_time)
+            embed.set_footer(text="Last updated:")
 
         # embed.set_footer(text=Texts.EMBED_FOOTER.format(
         #     self.bot.user.name))  # type: ignore
 
+        self.embeds.set(key, embed)
         return embed
 
+    def _invalidate_embeds(self, entry: FaqEntry):
+        # edits within the same second keep the modification time, so the embeds are removed explicitly
+        for tag in entry.tags:
+            self.embeds.pop((tag.lower(), entry.modification_time))
+
     def _get_tags_as_pages(
             self, ctx: discord.ApplicationContext) -> list[discord.Embed]:
         '''
@@ -85,12 +132,33 @@ class Faq(commands.Cog):
             # overwrite mobile status with web status
             mobile = False
 
+        # both layouts are built once per faq version
+        if self._tag_pages_version != self.data.version:
+            self._tag_pages = {
+                layout: self._build_tag_pages(layout)
+                for layout in (False, True)
+            }
+            self._tag_pages_version = self.data.version
+
+        # the paginator gets its own list, the embeds are shared
+        return list(self._tag_pages[mobile])
+
+    def _build_tag_pages(self, mobile: bool) -> list[discord.Embed]:
+        '''
+        Builds the pages of all FAQ Tags for one layout
+
+        :param mobile: If each tag should be put on a new line instead of in columns
+        :type mobile: bool
+        :return: A list of all pages
+        :rtype: list[discord.Embed]
+        '''
         # get all tags and add them to a list
         tag_pages: list[discord.Embed] = []
+        all_tags = self.data.get_all_tags(-1)
 
         AMOUNT = 20
-        for page in range(math.ceil(len(self.data.get_all_tags(-1)) / AMOUNT)):
-            tags = self.data.get_all_tags(AMOUNT, AMOUNT * page)
+        for page in range(math.ceil(len(all_tags) / AMOUNT)):
+            tags = all_tags[AMOUNT * page:AMOUNT * (page + 1)]
 
             # tabulate data
             lines = tags if mobile else tabulate(tags, 1, 62)
@@ -115,9 +183,44 @@ class Faq(commands.Cog):
             f'loaded {__name__}.{__class__.__name__} on server(s) {ids.servers}'
         )
 
+        # load config file
+        self.config = await ConfigUtil.create(Consts.CONFIG_PATH)
+
         # load faq file
-        self.data = await FaqUtil.create('config/faq.json')
-        self.deleted_data = await FaqUtil.create('config/faq_bin.json')
+        self.data = await FaqUtil.create('config/faq.json',
+                                         self.config.data.faq_storage)
+        self.deleted_data = await FaqUtil.create('config/faq_bin.json',
+                                                 self.config.data.faq_storage)
+
+        # on_ready is called again after a reconnect, the workers of the old matcher must not be leaked
+        if hasattr(self, 'matcher'):
+            self.matcher.close()
+
+        # start the matcher
+        self.matcher = FaqMatcher(
+            self.data,
+            mode=self.config.data.faq_match_mode,
+            workers=self.config.data.faq_match_workers,
+            timeout=self.config.data.faq_match_timeout,
+            unmatched_ttl=self.config.data.faq_unmatched_ttl,
+            engine=self.config.data.faq_match_engine,
+            scorer=self.config.data.faq_match_scorer,
+        )
+
+        self.autocomplete = TagAutocomplete(self.data, self.matcher)
+
+        # (channel id, tag) of recent auto-answers, mapped to the link of the answer
+        self.recent_answers: TTLCache[tuple[int, str], str] = TTLCache(
+            256, self.config.data.faq_answer_ttl)
+
+        # (lowercase tag, modification time) -> prebuilt embed of the faq
+        self.embeds: TTLCache[tuple[str, int], discord.Embed] = TTLCache(
+            self.config.data.faq_embed_cache_size, float('inf'))
+        self.data.listeners.append(self._invalidate_embeds)
+
+        # layout (mobile or not) -> pages of `/faq list`, rebuilt if the faq version changed
+        self._tag_pages: dict[bool, list[discord.Embed]] = {}
+        self._tag_pages_version = -1
 
     @commands.Cog.listener()
     async def on_message(self, msg: discord.Message):
@@ -128,51 +231,23 @@ class Faq(commands.Cog):
         if len(msg.content) == 0 or msg.content[0] != '?':
             return
 
-        percentages = [85, 75, 65]
+        # search tags, titles and descriptions outside of the event loop
+        tag = await self.matcher.match(msg.content)
 
-        # search tags
-        res = process.extract(
-            msg.content,
-            self.data.get_all_tags(-1),
-            limit=1,
-        )
-
-        res = [tag[0] for tag in res if tag[1] >= percentages[0]]
-
-        if len(res) != 1:
-            # search titles
-            res = process.extract(
-                msg.content,
-                {i.tags[0]: i.title
-                 for i in self.data.data},
-                limit=1,
-            )
-
-            res = [
-                tag[2] for tag in res  # type: ignore
-                if tag[1] >= percentages[1]
-            ]
-
-        if len(res) != 1:
-            # search descriptions
-            res = process.extract(
-                msg.content,
-                {i.tags[0]: i.description
-                 for i in self.data.data},
-                limit=1,
-            )
-
-            res = [
-                tag[2] for tag in res  # type: ignore
-                if tag[1] >= percentages[2]
-            ]
+        if tag is None:
+            return
 
-        if len(res) != 1:
+        # do not repeat the same answer in a channel, link to the recent one instead
+        key = (msg.channel.id, tag)
+        if (recent := self.recent_answers.get(key)) is not None:
+            await msg.reply(f'This was answered recently: {recent}',
+                            mention_author=False)
             return
 
-        embed = self._create_faq_embed(res[0])  # type: ignore
+        embed = self._create_faq_embed(tag)
         # embed.set_author(name='Auto-Support')
         ans = await msg.channel.send(embed=embed)
+        self.recent_answers.set(key, ans.jump_url)
 
         # make faq removable
 
@@ -193,6 +268,7 @@ class Faq(commands.Cog):
             await ans.remove_reaction('🚫', self.bot.user)  # type: ignore
         else:
             await ans.delete()
+            self.recent_answers.pop(key)
 
     # ADMIN
     # create SlashCommandGroup to structure the commands
@@ -240,7 +316,7 @@ class Faq(commands.Cog):
     @faqmanage.command()
     async def download(self, ctx: discord.ApplicationContext):
         '''Download faq.json'''
-        file = self.data.download_faq()
+        file = await self.data.download_faq()
         await ctx.send_response(f"{file.filename}", file=file)
 
     # USER
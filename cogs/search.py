@@ -1,12 +1,32 @@
+import asyncio
+
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from classes.algolia import AlgoliaResult
 
 from main import ids
 from utils.algolia import AlgoliaUtil
+from utils.cache import TTLCache
 from utils.config import ConfigUtil
+from utils.metadata_cache import MetadataCache
+from utils.query_suggest import QuerySuggestions
 from utils.variables import Consts, Texts
-from collections import OrderedDict
+from utils.wiki_mirror import WikiMirror
+
+
+def sizeof_results(res: list[AlgoliaResult]) -> int:
+    '''
+    Estimates the memory used by search results
+
+    :param res: The results
+    :type res: list[AlgoliaResult]
+    :return: The approximate size in bytes
+    :rtype: int
+    '''
+    # about 200 bytes for the objects, plus the strings
+    return sum(
+        200 + len(i.header) + len(i.description or '') + len(i.url) +
+        sum(len(h) for h in i.highlight) for i in res)
 
 
 def create_result_embed(
@@ -49,12 +69,14 @@ def create_details_embed(
     url: str,
     bot: discord.Bot,
 ) -> discord.Embed:
-    embed = discord.Embed(title=title,
+    # pages without open graph tags only have a url
+    embed = discord.Embed(title=title or url,
                           description=description,
                           url=url,
                           color=discord.Color.blurple())
 
-    embed.set_author(name=site)
+    if site:
+        embed.set_author(name=site)
     embed.set_thumbnail(url=image)
 
     embed.set_footer(text=Texts.EMBED_FOOTER.format(
@@ -67,29 +89,91 @@ class Search(commands.Cog):
 
     def __init__(self, bot: discord.Bot) -> None:
         self.bot = bot
-        self._search_cache: OrderedDict[int,
-                                        list[AlgoliaResult]] = OrderedDict()
+        # the last search of every user, the limits are set from the config when the cog is ready
+        self._search_cache: TTLCache[int, list[AlgoliaResult]] = TTLCache(
+            1000, 900, max_bytes=1_000_000, sizeof=sizeof_results)
+        # queries, which returned results, for the autocomplete of `/wiki search`
+        self.suggestions = QuerySuggestions()
+
+    def cog_unload(self):
+        self.sync_mirror.cancel()
+        asyncio.create_task(self.close())
+
+    async def close(self):
+        '''Closes the connections to algolia and the wiki, called on unload and when the bot shuts down'''
+        if hasattr(self, 'algolia'):
+            await self.algolia.close()
+
+    def get_stats(self) -> dict[str, str]:
+        '''Gets the statistics of this cog, which are displayed by `/stats`'''
+        # only sessions of users, which can still use `/wiki details`, are counted
+        self.search_cache.purge()
+        return {
+            'HTTP':
+            str(self.algolia.stats),
+            'Algolia requests':
+            str(self.algolia.client.stats),
+            'Search cache':
+            f'cached searches: {len(self.algolia.results)}\n'
+            f'hits: {self.algolia.results.hits}\n'
+            f'outdated hits: {self.algolia.results.stale_hits}\n'
+            f'misses: {self.algolia.results.misses}\n'
+            f'background refreshes: {self.algolia.refreshes}',
+            'Coalesced requests':
+            f'searches: {self.algolia.search_flights.calls} sent, '
+            f'{self.algolia.search_flights.shared} shared\n'
+            f'details: {self.algolia.metadata_flights.calls} sent, '
+            f'{self.algolia.metadata_flights.shared} shared',
+            'Metadata cache':
+            f'cached pages: {len(self.metadata_cache)}\n'
+            f'hits: {self.metadata_cache.hits}\n'
+            f'revalidated: {self.metadata_cache.revalidated}\n'
+            f'downloaded: {self.metadata_cache.misses}\n'
+            f'prefetched: {self.algolia.prefetched}\n'
+            f'evictions: {self.metadata_cache.evictions}',
+            'Search sessions':
+            f'users: {len(self.search_cache)}/{self.search_cache.maxsize}\n'
+            f'memory: {self.search_cache.bytes // 1000}/'
+            f'{(self.search_cache.max_bytes or 0) // 1000} kB\n'
+            f'evictions: {self.search_cache.evictions}\n'
+            f'expirations: {self.search_cache.expirations}',
+            'Wiki mirror':
+            f'records: {len(self.mirror)}\n'
+            f'age: {self.mirror.age / 3600:.1f} h\n'
+            f'syncs: {self.mirror.syncs}\n'
+            f'local searches: {self.mirror.searches}\n'
+            f'fallbacks for algolia: {self.algolia.fallbacks}'
+            if self.mirror is not None else 'disabled',
+            'Query suggestions':
+            f'suggestions: {len(self.suggestions)}\n'
+            f'recorded searches: {self.suggestions.recorded}\n'
+            f'completions: {self.suggestions.completions}',
+        }
+
+    async def _get_query_autocomplete(self,
+                                      ctx: discord.AutocompleteContext):
+        # suggest earlier searches, without asking algolia on every keystroke
+        return self.suggestions.suggest(ctx.value)
 
     @property
-    def search_cache(self):
+    def search_cache(self) -> TTLCache[int, list[AlgoliaResult]]:
         return self._search_cache
 
     def add_search_cache(self, key: int, val: list[AlgoliaResult]):
         '''
         Cache for search results
 
-        This method adds an new AlgoliaResult to the search_cache, so the user can request details with `/wiki details`.
-        
-        Only 10 AlgoliaResults are cached, the oldest will be deleted.
+        This method stores the last AlgoliaResults of a user, so the user can request details with `/wiki details`.
+
+        Results time out after `search_session_ttl` seconds. If more than `search_session_size` users
+        or more than `search_session_bytes` are cached, the least recently used results are deleted.
 
         :param key: The Key, most of the time it is the author.id
         :type key: int
         :param val: The AlgoliaResults the user requested
         :type val: list[AlgoliaResult]
         '''
-        self._search_cache[key] = val  # type: ignore
-        if len(self._search_cache.keys()) > 10:
-            self._search_cache.popitem(False)
+        self._search_cache.set(key, val)
 
     @commands.Cog.listener()
     async def on_ready(self):
@@ -99,19 +183,60 @@ class Search(commands.Cog):
 
         self.config = await ConfigUtil.create(Consts.CONFIG_PATH)
 
+        self._search_cache.maxsize = self.config.data.search_session_size
+        self._search_cache.ttl = self.config.data.search_session_ttl
+        self._search_cache.max_bytes = self.config.data.search_session_bytes
+
+        # on_ready is called again after a reconnect, the old session must not be leaked
+        await self.close()
+        self.metadata_cache = await MetadataCache.create(
+            'config/metadata_cache.json',
+            maxsize=self.config.data.metadata_cache_size,
+            fresh_ttl=self.config.data.metadata_cache_ttl,
+        )
+        self.mirror = await WikiMirror.create(
+            'config/wiki_mirror.json',
+            max_age=self.config.data.algolia_mirror_max_age,
+        ) if self.config.data.algolia_mirror_interval > 0 else None
         self.algolia = AlgoliaUtil(
             self.config.data.algolia_app_id,
             self.config.data.algolia_auth_key,
             self.config.data.algolia_index_name,
+            cache_size=self.config.data.algolia_cache_size,
+            cache_ttl=self.config.data.algolia_cache_ttl,
+            cache_stale_ttl=self.config.data.algolia_cache_stale_ttl,
+            metadata_cache=self.metadata_cache,
+            mirror=self.mirror,
+            deadline=self.config.data.algolia_deadline,
+            hedge=self.config.data.algolia_hedge,
         )
 
+        if self.mirror is not None and not self.sync_mirror.is_running():
+            self.sync_mirror.start()
+
+    @tasks.loop(minutes=10)
+    async def sync_mirror(self):
+        # the age is checked often, so a restart does not delay or repeat the sync
+        if self.mirror is None or (self.mirror.age <
+                                   self.config.data.algolia_mirror_interval):
+            return
+
+        try:
+            records = await self.algolia.sync_mirror()
+            print(f'synced {records} records of the wiki mirror')
+        except Exception as ex:
+            print(f'Failed to sync the wiki mirror: {ex}')
+
     wiki = discord.SlashCommandGroup(
         'wiki',
         'Search the wiki',
     )
 
     @wiki.command()
-    @discord.option('query', str, description='The query to search for')
+    @discord.option('query',
+                    str,
+                    description='The query to search for',
+                    autocomplete=_get_query_autocomplete)
     @discord.option(
         'max',
         int,
@@ -127,21 +252,25 @@ class Search(commands.Cog):
             ctx.author.id,  # type: ignore
             ans,
         )  # type: ignore
+        self.suggestions.record(query, ans)
 
         # create an embed for every result
         embed = create_result_embed(query, ans, self.bot)
 
         await ctx.send_response(embed=embed)
 
+        # users nearly always ask for the details of the first results next
+        self.algolia.prefetch_metadata(
+            [i.url for i in ans[:self.config.data.metadata_prefetch]])
+
     @wiki.command()
     async def details(self, ctx: discord.ApplicationContext, id: int):
         '''Show additional details for a search result'''
         id -= 1
         # get cached results
         # if there is nothing cached, send error
-        try:
-            res = self.search_cache[ctx.author.id]  # type: ignore
-        except KeyError:
+        res = self.search_cache.get(ctx.author.id)  # type: ignore
+        if res is None:
             # get wiki-group to mention it
             cmd = self.bot.get_application_command(
                 'wiki', type=discord.SlashCommandGroup)
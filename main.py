@@ -9,6 +9,7 @@ from discord.ext import commands, tasks
 from dotenv import load_dotenv
 
 from utils import loader
+from utils.persistence import writer
 from utils.variables import Ids, Presences
 
 # start logging
@@ -25,7 +26,19 @@ load_dotenv()
 
 intents = discord.Intents.all()
 
-bot = commands.Bot(intents=intents)
+
+class Bot(commands.Bot):
+
+    async def close(self):
+        # write all pending changes and close the connections of the cogs before shutting down
+        await writer.flush()
+        for cog in list(self.cogs.values()):
+            if hasattr(cog, 'close'):
+                await cog.close()  # type: ignore
+        await super().close()
+
+
+bot = Bot(intents=intents)
 
 # load ids
 ids = Ids('config/ids.jsonc')
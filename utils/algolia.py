@@ -1,59 +1,262 @@
 # import requests
 
+import asyncio
+from functools import partial
 from typing import Tuple
 import aiohttp
 
 from classes.algolia import AlgoliaResult, AlgoliaResultType
-from bs4 import BeautifulSoup
+
+from utils.cache import TTLCache
+from utils.hedged import HedgedClient
+from utils.http import HttpStats, create_session
+from utils.metadata_cache import MetadataCache
+from utils.og import OG_FIELDS, read_og
+from utils.singleflight import SingleFlight
+from utils.wiki_mirror import WikiMirror, record_from_hit
+
+# the bytes after the head of a page, which are still read in the background to keep the connection alive
+DRAIN_BYTES = 256 * 1024
 
 
 class AlgoliaUtil:
 
-    def __init__(self, app: str, key: str, index_name: str) -> None:
+    def __init__(self,
+                 app: str,
+                 key: str,
+                 index_name: str,
+                 cache_size: int = 256,
+                 cache_ttl: float = 600,
+                 cache_stale_ttl: float = 3600,
+                 metadata_cache: MetadataCache | None = None,
+                 prefetch_workers: int = 2,
+                 mirror: WikiMirror | None = None,
+                 hosts: list[str] | None = None,
+                 deadline: float = 2.5,
+                 hedge: bool = True) -> None:
+        '''
+        :param app: The algolia application id
+        :type app: str
+        :param key: The algolia api key
+        :type key: str
+        :param index_name: The name of the searched index
+        :type index_name: str
+        :param cache_size: The maximal amount of cached searches, defaults to 256
+        :type cache_size: int, optional
+        :param cache_ttl: The seconds a search result is fresh, defaults to 600
+        :type cache_ttl: float, optional
+        :param cache_stale_ttl: The seconds an outdated search result is still returned while it is refreshed, defaults to 3600
+        :type cache_stale_ttl: float, optional
+        :param metadata_cache: The persistent cache of page metadata, defaults to None
+        :type metadata_cache: MetadataCache | None, optional
+        :param prefetch_workers: The maximal amount of simultaneous prefetches, defaults to 2
+        :type prefetch_workers: int, optional
+        :param mirror: The local copy of the index, which is searched before algolia while it is fresh, defaults to None
+        :type mirror: WikiMirror | None, optional
+        :param hosts: The urls of the algolia api in the order they are tried, e.g. of fake servers for testing, defaults to the algolia hosts of the app
+        :type hosts: list[str] | None, optional
+        :param deadline: The seconds a search may take, including retries on other hosts, defaults to 2.5
+        :type deadline: float, optional
+        :param hedge: If a second host is asked when the first one is slower than usual, defaults to True
+        :type hedge: bool, optional
+        '''
         self.app = app
         self.key = key
         self.index_name = index_name
 
-        self.base_url = 'https://{}-dsn.algolia.net{}'
         self.headers = {
             'X-Algolia-Application-Id': self.app,
             'X-Algolia-API-Key': self.key
         }
+        # the dsn host is the nearest replica, the others are the fallbacks of every algolia client
+        self.client = HedgedClient(
+            lambda: self.session,
+            hosts or [
+                f'https://{self.app}-dsn.algolia.net',
+                *(f'https://{self.app}-{i}.algolianet.com' for i in (1, 2, 3))
+            ],
+            headers=self.headers,
+            deadline=deadline,
+            hedge=hedge,
+        )
+
+        self.stats = HttpStats()
+        self._session: aiohttp.ClientSession | None = None
+
+        # results of (normalized query, amount of hits)
+        self.results: TTLCache[tuple[str, int],
+                               list[AlgoliaResult]] = TTLCache(
+                                   cache_size, cache_ttl, cache_stale_ttl)
+        self._refreshing: dict[tuple[str, int], asyncio.Task] = {}
+        self.refreshes = 0
+        self.metadata_cache = metadata_cache
+
+        # concurrent identical requests share one request
+        self.search_flights: SingleFlight[tuple[str, int],
+                                          list[AlgoliaResult]] = SingleFlight()
+        self.metadata_flights: SingleFlight[str, Tuple[
+            str, str, str, str, str, str]] = SingleFlight()
+
+        # metadata is prefetched into the metadata cache, with fewer requests at once than the users make
+        self._prefetch_slots = asyncio.Semaphore(prefetch_workers)
+        self._prefetches: dict[str, asyncio.Task] = {}
+        self.prefetched = 0
+        # responses, whose rest is read after their metadata was returned
+        self._drains: set[asyncio.Task] = set()
+
+        self.mirror = mirror
+        # searches answered by the mirror, because algolia failed
+        self.fallbacks = 0
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        '''
+        The shared session of all requests, it is (re)opened when it is needed
+        '''
+        if self._session is None or self._session.closed:
+            self._session = create_session(self.stats)
+        return self._session
+
+    async def close(self):
+        '''Closes the shared session and all of its connections'''
+        for task in self._refreshing.values():
+            task.cancel()
+        self.cancel_prefetches()
+        for task in self._drains:
+            task.cancel()
+
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
 
     async def _get_data(self, path: str, data: dict[str, str | int]):
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                    self.base_url.format(self.app, path),
-                    headers=self.headers,
-                    json={
-                        **data,
-                        'highlightPreTag':
-                        '***__',
-                        'highlightPostTag':
-                        '__***',
-                        'attributesToRetrieve': [
-                            'hierarchy.lvl0', 'hierarchy.lvl1',
-                            'hierarchy.lvl2', 'content', 'type', 'url'
-                        ],
-                        'attributesToSnippet': [
-                            'hierarchy.lvl0:10', 'hierarchy.lvl1:10',
-                            'hierarchy.lvl2:10', 'hierarchy.lvl6:10',
-                            'content:10'
-                        ],
-                        'snippetEllipsisText':
-                        '...',
-                    },
-            ) as ans:
-                return await ans.json()
+        return await self.client.post(
+            path,
+            {
+                **data,
+                'highlightPreTag':
+                '***__',
+                'highlightPostTag':
+                '__***',
+                'attributesToRetrieve': [
+                    'hierarchy.lvl0', 'hierarchy.lvl1',
+                    'hierarchy.lvl2', 'content', 'type', 'url'
+                ],
+                'attributesToSnippet': [
+                    'hierarchy.lvl0:10', 'hierarchy.lvl1:10',
+                    'hierarchy.lvl2:10', 'hierarchy.lvl6:10',
+                    'content:10'
+                ],
+                'snippetEllipsisText':
+                '...',
+            },
+        )
 
     async def search_query(self,
                            query: str,
                            max: int = 5) -> list[AlgoliaResult]:
+        '''
+        Searches the wiki. Results are cached, outdated results are returned immediately and refreshed in the background
+
+        :param query: The query to search for
+        :type query: str
+        :param max: The maximum amount of results, at most 5, defaults to 5
+        :type max: int, optional
+        :return: The results
+        :rtype: list[AlgoliaResult]
+        '''
+        key = (' '.join(query.casefold().split()), min(max, 5))
+
+        # algolia is only asked if the mirror is outdated or finds nothing
+        mirror = self.mirror
+        if mirror is not None and mirror.is_fresh() and (results :=
+                                                         mirror.search(*key)):
+            return results
+
+        try:
+            return await self._search_cached(key)
+        except Exception as ex:
+            if mirror is None or not len(mirror):
+                raise
+
+            print(f'Failed to search algolia, using the mirror: {ex}')
+            self.fallbacks += 1
+            # without algolia, records with only some words of the query are better than nothing
+            return mirror.search(*key, min_share=0)
+
+    async def _search_cached(self,
+                             key: tuple[str, int]) -> list[AlgoliaResult]:
+        cached = self.results.get_stale(key)
+        if cached is not None:
+            results, stale = cached
+            if stale and key not in self._refreshing:
+                self._refreshing[key] = asyncio.create_task(
+                    self._refresh(key))
+            return results
+
+        return await self.search_flights.do(key, partial(self._update, key))
+
+    async def _update(self, key: tuple[str, int]) -> list[AlgoliaResult]:
+        results = await self._search(*key)
+        self.results.set(key, results)
+        return results
+
+    async def _refresh(self, key: tuple[str, int]):
+        try:
+            await self.search_flights.do(key, partial(self._update, key))
+            self.refreshes += 1
+        except Exception as ex:
+            # the outdated result is returned until the next refresh works
+            print(f'Failed to refresh the search for {key[0]}: {ex}')
+        finally:
+            del self._refreshing[key]
+
+    async def sync_mirror(self) -> int:
+        '''
+        Downloads all records of the index with the browse api and replaces the records of the mirror
+
+        :return: The amount of records in the mirror
+        :rtype: int
+        '''
+        if self.mirror is None:
+            return 0
+
+        records = []
+        cursor: str | None = None
+        while True:
+            data: dict[str, str | int | list[str]] = {
+                'hitsPerPage': 1000,
+                'attributesToRetrieve': [
+                    'hierarchy.lvl0', 'hierarchy.lvl1', 'hierarchy.lvl2',
+                    'content', 'type', 'url'
+                ],
+            }
+            if cursor is not None:
+                data['cursor'] = cursor
+
+            # fails if the api key is not allowed to browse
+            # a page takes longer than a search, so it gets more time
+            page = await self.client.post(
+                f'/1/indexes/{self.index_name}/browse', data, deadline=30)
+
+            records += [
+                record for hit in page['hits']
+                if (record := record_from_hit(hit)) is not None
+            ]
+
+            # the cursor is missing on the last page
+            if not (cursor := page.get('cursor')):
+                break
+
+        await self.mirror.update(records)
+        return len(records)
+
+    async def _search(self, query: str, max: int) -> list[AlgoliaResult]:
         ans = await self._get_data(
             f'/1/indexes/{self.index_name}/query',
             {
                 'query': query,
-                'hitsPerPage': min(max, 5),
+                'hitsPerPage': max,
             },
         )
 
@@ -102,52 +305,123 @@ class AlgoliaUtil:
 
     async def get_metadata(self,
                            url: str) -> Tuple[str, str, str, str, str, str]:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as ans:
-                soup = BeautifulSoup(await ans.read(), 'html.parser')
-                title: str = soup.find(
-                    'meta',
-                    attrs={
-                        'name': 'og:title'
-                    },
-                ).get('content')  # type: ignore
-
-                description: str = soup.find(
-                    'meta',
-                    attrs={
-                        'name': 'og:description'
-                    },
-                ).get('content')  # type: ignore
-
-                image: str = soup.find(
-                    'meta',
-                    attrs={
-                        'name': 'og:image'
-                    },
-                ).get('content')  # type: ignore
-
-                image_alt: str = soup.find(
-                    'meta',
-                    attrs={
-                        'name': 'og:image:alt'
-                    },
-                ).get('content')  # type: ignore
-
-                site: str = soup.find(
-                    'meta',
-                    attrs={
-                        'name': 'og:site_name'
-                    },
-                ).get('content')  # type: ignore
-
-                url_full: str = soup.find(
-                    'meta',
-                    attrs={
-                        'name': 'og:url'
-                    },
-                ).get('content')  # type: ignore
-
-                return title, description, image, image_alt, site, url_full
+        '''
+        Gets the open graph metadata of a wiki page. Concurrent calls for the same url share one request
+
+        Missing fields are empty, except the url, which falls back to the requested url.
+
+        :param url: The url of the page
+        :type url: str
+        :return: The title, description, image, image alt text, site name and full url of the page
+        :rtype: Tuple[str, str, str, str, str, str]
+        '''
+        return await self.metadata_flights.do(
+            url, partial(self._get_metadata, url))
+
+    def prefetch_metadata(self, urls: list[str]):
+        '''
+        Loads the metadata of pages into the metadata cache in the background, so `get_metadata` is answered from memory
+
+        Pages which are cached and fresh or already prefetched are skipped.
+        Prefetches share the request with concurrent `get_metadata` calls for the same page.
+
+        :param urls: The urls of the pages
+        :type urls: list[str]
+        '''
+        cache = self.metadata_cache
+        if cache is None:
+            return
+
+        for url in urls:
+            if url in self._prefetches or (
+                (entry := cache.get(url)) is not None and cache.is_fresh(entry)):
+                continue
+
+            self._prefetches[url] = asyncio.create_task(self._prefetch(url))
+
+    def cancel_prefetches(self):
+        '''Cancels all prefetches, running requests still finish for other callers'''
+        for task in self._prefetches.values():
+            task.cancel()
+
+    async def _prefetch(self, url: str):
+        try:
+            async with self._prefetch_slots:
+                await self.get_metadata(url)
+                self.prefetched += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception as ex:
+            print(f'Failed to prefetch {url}: {ex}')
+        finally:
+            del self._prefetches[url]
+
+    async def _get_metadata(self,
+                            url: str) -> Tuple[str, str, str, str, str, str]:
+        cache = self.metadata_cache
+        entry = cache.get(url) if cache is not None else None
+        if cache is not None and entry is not None and cache.is_fresh(entry):
+            cache.hits += 1
+            return tuple(entry.metadata)  # type: ignore
+
+        headers = cache.headers(entry) if cache is not None else {}
+        ans = await self.session.get(url, headers=headers)
+        # the response is released by the background task after the metadata was returned
+        draining = False
+        try:
+            if cache is not None and entry is not None and ans.status == 304:
+                # the page did not change since it was cached
+                cache.revalidated += 1
+                cache.touch(url)
+                return tuple(entry.metadata)  # type: ignore
+
+            # only the head is read before returning
+            fields, _ = await read_og(ans.content.iter_chunked(8192))
+            title, description, image, image_alt, site, url_full = (
+                fields.get(field, '') for field in OG_FIELDS)
+            metadata = (title, description, image, image_alt, site, url_full
+                        or url)
+
+            if cache is not None and ans.status == 200:
+                cache.misses += 1
+                cache.set(url, list(metadata), ans.headers.get('ETag'),
+                          ans.headers.get('Last-Modified'))
+
+            self._drain_later(ans)
+            draining = True
+            return metadata
+        finally:
+            if not draining:
+                ans.release()
+
+    def _drain_later(self, ans: aiohttp.ClientResponse):
+        '''
+        Reads the rest of a small page in the background and releases the response
+
+        aiohttp closes connections with unread bodies, so the rest is read to return the connection to the pool.
+        For larger pages, a new connection is cheaper than downloading the rest.
+        '''
+        if ans.content_length is not None and ans.content_length > DRAIN_BYTES:
+            ans.close()
+            return
+
+        task = asyncio.create_task(self._drain(ans))
+        self._drains.add(task)
+        task.add_done_callback(self._drains.discard)
+
+    async def _drain(self, ans: aiohttp.ClientResponse):
+        try:
+            drained = 0
+            async for chunk in ans.content.iter_chunked(8192):
+                drained += len(chunk)
+                if drained > DRAIN_BYTES:
+                    break
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            # the metadata was already returned, the connection is closed below
+            pass
+        finally:
+            # the connection is reused if the whole page was read and closed otherwise
+            ans.release()
 
 
 # ans = requests.post(
@@ -0,0 +1,105 @@
+'''
+Util for autocompleting faq tags
+'''
+
+from dataclasses import dataclass
+
+from utils.cache import TTLCache
+from utils.faq import FaqUtil
+from utils.matcher import FaqMatcher
+
+# discord does not accept more choices
+MAX_CHOICES = 25
+
+
+@dataclass(frozen=True)
+class Completion:
+    tags: list[str]
+    # all tags with the query as prefix, None if there were more than MAX_CHOICES
+    prefix_tags: list[str] | None
+
+
+class TagAutocomplete:
+    '''
+    Autocompletes tags by their prefix first
+
+    Fuzzy matching is only used if there are not enough tags with the typed prefix.
+    Results are memoized per faq version, the result of the previous keystroke is used to narrow down the next one.
+    '''
+
+    def __init__(self,
+                 faq: FaqUtil,
+                 matcher: FaqMatcher,
+                 min_prefix_hits: int = 5,
+                 maxsize: int = 1024) -> None:
+        self.faq = faq
+        self.matcher = matcher
+        self.min_prefix_hits = min_prefix_hits
+
+        # (normalized query, faq version) -> completion
+        self.memo: TTLCache[tuple[str, int], Completion] = TTLCache(
+            maxsize, float('inf'))
+        self._version = faq.version
+
+        self.hits = 0
+        self.misses = 0
+        self.narrowed = 0
+
+    def _get_prefix_tags(self, value: str) -> list[str]:
+        # every tag starting with the value starts with the previous keystroke as well
+        if value:
+            previous = self.memo.get((value[:-1], self.faq.version))
+            if previous is not None and previous.prefix_tags is not None:
+                self.narrowed += 1
+                return [t for t in previous.prefix_tags if t.startswith(value)]
+
+        return self.faq.get_tags_by_prefix(value, MAX_CHOICES + 1)
+
+    async def complete(self, value: str) -> list[str]:
+        '''
+        Gets the choices for an autocomplete value
+
+        :param value: The value the user typed
+        :type value: str
+        :return: The tags starting with the value, followed by the nearest tags. At most 25 tags
+        :rtype: list[str]
+        '''
+        value = value.strip().lower()
+
+        # drop all results of older versions
+        if self._version != self.faq.version:
+            self.memo.clear()
+            self._version = self.faq.version
+
+        key = (value, self.faq.version)
+        if (completion := self.memo.get(key)) is not None:
+            self.hits += 1
+            return completion.tags
+
+        self.misses += 1
+
+        prefix_tags = self._get_prefix_tags(value)
+        tags = prefix_tags[:MAX_CHOICES]
+
+        if value != '' and len(tags) < self.min_prefix_hits:
+            # fill up with the nearest tags, which are calculated by thefuzz
+            nearest = await self.matcher.autocomplete(value, MAX_CHOICES)
+            if nearest is None:
+                # the matcher timed out, the incomplete result is not memoized
+                return tags
+
+            for tag in nearest:
+                if tag not in tags:
+                    tags.append(tag)
+
+            tags = tags[:MAX_CHOICES]
+
+        self.memo.set(
+            key,
+            Completion(
+                tags=tags,
+                prefix_tags=prefix_tags
+                if len(prefix_tags) <= MAX_CHOICES else None,
+            ))
+
+        return tags
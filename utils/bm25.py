@@ -0,0 +1,125 @@
+'''
+Util for scoring a text against many documents at once with BM25
+'''
+
+from collections import Counter, defaultdict
+from math import log
+from typing import Sequence
+
+import numpy as np
+
+from utils.text import normalize
+
+
+class Bm25Index:
+    '''
+    Sparse term matrix of documents, weighted with BM25
+
+    Every term stores the documents containing it and their precomputed weights (one column of the matrix),
+    so a query is scored against all documents with one vectorized addition per query term.
+    '''
+
+    def __init__(self,
+                 documents: dict[str, Sequence[str]],
+                 k1: float = 1.2,
+                 b: float = 0.75) -> None:
+        '''
+        :param documents: The normalized tokens of the documents to index as `{key: tokens}`
+        :type documents: dict[str, Sequence[str]]
+        :param k1: How fast the weight of a term saturates with its frequency, defaults to 1.2
+        :type k1: float, optional
+        :param b: How strong the weights are normalized by the document length, defaults to 0.75
+        :type b: float, optional
+        '''
+        self.keys = list(documents.keys())
+        self.k1 = k1
+
+        tokens = list(documents.values())
+        lengths = np.array([len(t) for t in tokens], dtype=np.float64)
+        average = lengths.mean() if len(lengths) and lengths.mean() else 1
+
+        columns: defaultdict[str, tuple[list[int], list[int]]] = defaultdict(
+            lambda: ([], []))
+        for doc, doc_tokens in enumerate(tokens):
+            for term, frequency in Counter(doc_tokens).items():
+                column = columns[term]
+                column[0].append(doc)
+                column[1].append(frequency)
+
+        self._idf: dict[str, float] = {}
+        self._columns: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        for term, (docs, frequencies) in columns.items():
+            ids = np.array(docs, dtype=np.int64)
+            tf = np.array(frequencies, dtype=np.float64)
+            idf = log(1 + (len(self.keys) - len(docs) + 0.5) /
+                      (len(docs) + 0.5))
+
+            norm = k1 * (1 - b + b * lengths[ids] / average)
+            self._idf[term] = idf
+            self._columns[term] = (ids, idf * tf * (k1 + 1) / (tf + norm))
+
+        # terms, which are in none of the documents, are weighted like a term in a third of the documents
+        # as the rarest possible term, filler words of questions would push every score below the cutoffs,
+        # as the most common term, messages sharing only a common word with a document would match it
+        documents = len(self.keys) / 3
+        self._unknown_idf = log(1 + (len(self.keys) - documents + 0.5) /
+                                (documents + 0.5))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def scores(self, query: str) -> np.ndarray:
+        '''
+        Scores the query against all documents
+
+        :param query: The query
+        :type query: str
+        :return: The score of every document in the order of `keys`, 1 is about an exact match
+        :rtype: np.ndarray
+        '''
+        scores = np.zeros(len(self.keys), dtype=np.float64)
+        terms = set(normalize(query).split())
+        if not terms:
+            return scores
+
+        # the score of a document with average length, which contains every term once
+        best = 0.0
+        for term in terms:
+            best += self._idf.get(term, self._unknown_idf)
+
+            if (column := self._columns.get(term)) is not None:
+                scores[column[0]] += column[1]
+
+        return scores / best if best > 0 else scores
+
+    def matched_terms(self, query: str) -> np.ndarray:
+        '''
+        Counts the different terms of the query, which every document contains
+
+        :param query: The query
+        :type query: str
+        :return: The amount of matched terms of every document in the order of `keys`
+        :rtype: np.ndarray
+        '''
+        counts = np.zeros(len(self.keys), dtype=np.int64)
+        for term in set(normalize(query).split()):
+            if (column := self._columns.get(term)) is not None:
+                counts[column[0]] += 1
+
+        return counts
+
+    def top(self, query: str) -> tuple[str, float] | None:
+        '''
+        Gets the best matching document
+
+        :param query: The query
+        :type query: str
+        :return: The key and the score of the best document, None if there are no documents
+        :rtype: tuple[str, float] | None
+        '''
+        if not self.keys:
+            return None
+
+        scores = self.scores(query)
+        i = int(scores.argmax())
+        return self.keys[i], float(scores[i])
@@ -1,11 +1,17 @@
 # type: ignore
 '''
-Util for extending the default lru_cache by adding a timeout possibility
+Util for extending the default lru_cache by adding a timeout possibility and a bounded cache with timed out entries
 '''
 
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from functools import lru_cache as functools_lru_cache
 from functools import wraps
+from typing import Callable, Generic, Hashable, TypeVar
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
 
 
 def lru_cache(timeout: int, maxsize: int | None = None, typed: bool = False):
@@ -40,3 +46,175 @@ def lru_cache(timeout: int, maxsize: int | None = None, typed: bool = False):
         return _wrapped
 
     return _wrapper
+
+
+class TTLCache(Generic[K, V]):
+    '''
+    A bounded cache, which removes the least recently used entries first
+
+    Entries older than `ttl` seconds are treated as if they do not exist.
+    With `stale_ttl`, timed out entries are kept for that many seconds longer, so `get_stale` can return them
+    while they are refreshed.
+    With `max_bytes` and `sizeof`, the cache is also bounded by the approximate size of its values.
+    '''
+
+    def __init__(self,
+                 maxsize: int,
+                 ttl: float,
+                 stale_ttl: float = 0,
+                 max_bytes: int | None = None,
+                 sizeof: Callable[[V], int] | None = None) -> None:
+        '''
+        :param maxsize: The maximal amount of entries
+        :type maxsize: int
+        :param ttl: The amount of seconds before an entry times out
+        :type ttl: float
+        :param stale_ttl: The amount of seconds a timed out entry can still be returned by `get_stale`, defaults to 0
+        :type stale_ttl: float, optional
+        :param max_bytes: The maximal size of all values, defaults to None
+        :type max_bytes: int | None, optional
+        :param sizeof: The function, which estimates the size of a value in bytes, required for `max_bytes`, defaults to None
+        :type sizeof: Callable[[V], int] | None, optional
+        '''
+        if max_bytes is not None and sizeof is None:
+            raise ValueError('max_bytes requires sizeof')
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        # the keys in the order they were set, so expired entries are found without scanning all entries
+        self._written: OrderedDict[K, None] = OrderedDict()
+        self._sizes: dict[K, int] = {}
+        self.bytes = 0
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: K, default: V | None = None) -> V | None:
+        '''
+        Gets an entry and marks it as recently used
+
+        :param key: The key of the entry
+        :type key: K
+        :param default: The value returned if there is no entry or the entry timed out, defaults to None
+        :type default: V | None, optional
+        :return: The cached value or `default`
+        :rtype: V | None
+        '''
+        item = self._data.get(key)
+        age = time.monotonic() - item[0] if item is not None else 0
+        if item is None or age >= self.ttl:
+            # timed out entries are kept for `get_stale`
+            if item is not None and age >= self.ttl + self.stale_ttl:
+                self._remove(key)
+                self.expirations += 1
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def get_stale(self, key: K) -> tuple[V, bool] | None:
+        '''
+        Gets an entry, even if it timed out less than `stale_ttl` seconds ago, and marks it as recently used
+
+        :param key: The key of the entry
+        :type key: K
+        :return: The cached value and whether it timed out, None if there is no entry
+        :rtype: tuple[V, bool] | None
+        '''
+        item = self._data.get(key)
+        age = time.monotonic() - item[0] if item is not None else 0
+        if item is None or age >= self.ttl + self.stale_ttl:
+            if item is not None:
+                self._remove(key)
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        stale = age >= self.ttl
+        if stale:
+            self.stale_hits += 1
+        else:
+            self.hits += 1
+        return item[1], stale
+
+    def set(self, key: K, value: V):
+        '''
+        Adds or replaces an entry. The least recently used entries are removed if the cache is full
+
+        :param key: The key of the entry
+        :type key: K
+        :param value: The value to cache
+        :type value: V
+        '''
+        if key in self._data:
+            self._remove(key)
+
+        # expired entries must not count against `maxsize` and `max_bytes`
+        self.purge()
+
+        self._data[key] = (time.monotonic(), value)
+        self._written[key] = None
+        if self.sizeof is not None:
+            self._sizes[key] = self.sizeof(value)
+            self.bytes += self._sizes[key]
+
+        # a single value, which is larger than `max_bytes`, is still cached
+        while len(self._data) > self.maxsize or (
+                self.max_bytes is not None and self.bytes > self.max_bytes
+                and len(self._data) > 1):
+            self._remove(next(iter(self._data)))
+            self.evictions += 1
+
+    def pop(self, key: K, default: V | None = None) -> V | None:
+        '''
+        Removes an entry
+
+        :param key: The key of the entry
+        :type key: K
+        :param default: The value returned if there is no entry, defaults to None
+        :type default: V | None, optional
+        :return: The removed value or `default`
+        :rtype: V | None
+        '''
+        item = self._data.get(key)
+        if item is None:
+            return default
+
+        self._remove(key)
+        return item[1]
+
+    def purge(self):
+        '''Removes all entries, which timed out more than `stale_ttl` seconds ago'''
+        now = time.monotonic()
+        while self._written:
+            key = next(iter(self._written))
+            if now - self._data[key][0] < self.ttl + self.stale_ttl:
+                break
+
+            self._remove(key)
+            self.expirations += 1
+
+    def clear(self):
+        '''Removes all entries'''
+        self._data.clear()
+        self._written.clear()
+        self._sizes.clear()
+        self.bytes = 0
+
+    def _remove(self, key: K):
+        del self._data[key]
+        del self._written[key]
+        self.bytes -= self._sizes.pop(key, 0)
@@ -1,4 +1,5 @@
 from dataclasses import asdict
+from functools import partial
 from typing import Any
 
 import aiofiles
@@ -6,6 +7,7 @@ import json5 as json
 from dataclass_wizard import fromdict
 
 from classes.config import Config
+from utils.persistence import write_atomic, writer
 
 
 class ConfigUtil:
@@ -25,14 +27,14 @@ class ConfigUtil:
             return fromdict(Config, json.loads(await f.read()))  # type: ignore
 
     async def save_config(self, path: str):
-        async with aiofiles.open(path, 'w', encoding='utf-8') as f:
-            await f.write(
-                json.dumps(  # type: ignore
-                    asdict(self.data),
-                    ensure_ascii=True,
-                    indent=4,
-                    quote_keys=True,
-                    trailing_commas=False) + '\n')
+        await write_atomic(
+            path,
+            json.dumps(  # type: ignore
+                asdict(self.data),
+                ensure_ascii=True,
+                indent=4,
+                quote_keys=True,
+                trailing_commas=False) + '\n')
 
     async def change_config(self, key: str, value: Any) -> Config | None:
         '''
@@ -53,6 +55,6 @@ class ConfigUtil:
         except Exception:
             return None
 
-        # save config
-        await self.save_config(self.path)
+        # save config in the background
+        writer.mark_dirty(self.path, partial(self.save_config, self.path))
         return self.data
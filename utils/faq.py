@@ -1,51 +1,204 @@
 import os
-from dataclasses import asdict
-from typing import List
+from bisect import bisect_left, insort
+from dataclasses import asdict, dataclass
+from functools import cached_property
+from typing import Callable, List
 
-import aiofiles
 import discord
-import json5 as json
-from dataclass_wizard import fromlist
 
 from classes.faq import FaqEntry
-from utils.cache import lru_cache
+from utils.bm25 import Bm25Index
+from utils.faq_storage import FaqStorage, create_storage
+from utils.ngram import NgramIndex
+
+
+@dataclass(frozen=True)
+class FaqSnapshot:
+    '''An immutable copy of the faq data, which can safely be used by worker threads and processes'''
+    version: int
+    tags: tuple[str, ...]
+    tag_index: NgramIndex[str]
+    title_index: NgramIndex[str]
+    description_index: NgramIndex[str]
+
+    # the bm25 indices are only built when the bm25 match engine uses them
+    @cached_property
+    def title_bm25(self) -> Bm25Index:
+        return Bm25Index(self.title_index.tokens())
+
+    @cached_property
+    def description_bm25(self) -> Bm25Index:
+        return Bm25Index(self.description_index.tokens())
+
+    @cached_property
+    def normalized_tags(self) -> dict[str, str]:
+        return self.tag_index.normalized()
+
+
+def clean_tags(tags: List[str]) -> list[str]:
+    '''
+    Lowercases the tags and removes empty and repeated ones, keeping their order
+
+    :param tags: The tags, e.g. split from the input of a modal
+    :type tags: List[str]
+    :return: The cleaned tags
+    :rtype: list[str]
+    '''
+    return list(
+        dict.fromkeys(t for tag in tags if (t := tag.strip().lower())))
 
 
 class FaqUtil:
+    '''Holds the faq data and its indices, changes are saved by the storage backend'''
+
+    # removals after which the positions of the entries are renumbered
+    RENUMBER_AFTER = 64
 
-    def __init__(self, path: str, data: List[FaqEntry]) -> None:
+    def __init__(self,
+                 path: str,
+                 data: List[FaqEntry],
+                 storage: FaqStorage | None = None) -> None:
         self.path = path
         self.data = data
+        self.storage = storage
+
+        # incremented on every change of the data, used to invalidate everything derived from it
+        self.version = 0
+        self._snapshot: FaqSnapshot | None = None
+        # called with every entry before it is edited or after it was removed, to invalidate caches of single entries
+        self.listeners: list[Callable[[FaqEntry], None]] = []
+
+        # all tags, kept sorted on every change
+        self._tags: list[str] = []
+        # lowercase tag -> entry, for lookups and conflict checks
+        self._entries: dict[str, FaqEntry] = {}
+        # id of an entry -> its position in `data`, so it is removed without searching the list
+        self._positions: dict[int, int] = {
+            id(entry): i
+            for i, entry in enumerate(self.data)
+        }
+        # removals since the positions were renumbered, every entry moved at most this far to the front
+        self._removed = 0
+
+        # n-gram indices to narrow down the fuzzy search of the auto-answer
+        # tags are indexed by themselves, titles and descriptions by the first tag of their entry
+        self.tag_index: NgramIndex[str] = NgramIndex()
+        self.title_index: NgramIndex[str] = NgramIndex()
+        self.description_index: NgramIndex[str] = NgramIndex()
+
+        for entry in self.data:
+            self._index_entry(entry)
 
     @classmethod
-    async def create(cls, path: str):
-        '''Creates the FaqUtil class, loads the file and returns the class.'''
-        data = await cls.load_faq(cls, path)
-        return cls(path, data)
-
-    async def load_faq(self, path: str) -> list[FaqEntry]:
-        try:
-            async with aiofiles.open(path, 'r', encoding='utf-8') as f:
-                return [
-                    *fromlist(FaqEntry, json.loads(await
-                                                   f.read()))  # type: ignore
-                ]
-        except FileNotFoundError:
-            # faq does not exist, create file
-            print('No faq.json-file found, creating new one...')
-            async with aiofiles.open(path, 'w', encoding='utf-8') as f:
-                await f.write('')
-                return []
-
-    async def save_faq(self, path: str):
-        async with aiofiles.open(path, 'w', encoding='utf-8') as f:
-            await f.write(
-                json.dumps(  # type: ignore
-                    [asdict(i) for i in self.data],
-                    ensure_ascii=True,
-                    indent=4,
-                    quote_keys=True,
-                    trailing_commas=False))
+    async def create(cls, path: str, backend: str = 'json'):
+        '''Creates the FaqUtil class, loads the faq from the storage backend (`json` or `sqlite`) and returns the class.'''
+        storage = create_storage(path, backend)
+        data = await storage.load()
+        return cls(path, data, storage)
+
+    def snapshot(self) -> FaqSnapshot:
+        '''
+        Gets an immutable copy of the current data. The copy is only recreated if the data changed
+
+        :return: The snapshot of the current version
+        :rtype: FaqSnapshot
+        '''
+        if self._snapshot is None or self._snapshot.version != self.version:
+            self._snapshot = FaqSnapshot(
+                version=self.version,
+                tags=tuple(self._tags),
+                tag_index=self.tag_index.copy(),
+                title_index=self.title_index.copy(),
+                description_index=self.description_index.copy(),
+            )
+
+        return self._snapshot
+
+    def _index_entry(self, entry: FaqEntry):
+        '''Adds an entry to all indices. Needs to be called after an entry was added or edited'''
+        for tag in entry.tags:
+            insort(self._tags, tag)
+            self._entries[tag.lower()] = entry
+            self.tag_index.add(tag, tag)
+
+        if entry.tags:
+            self.title_index.add(entry.tags[0], entry.title)
+            self.description_index.add(entry.tags[0], entry.description)
+
+        self.version += 1
+
+    def _unindex_entry(self, entry: FaqEntry):
+        '''Removes an entry from all indices. Needs to be called before an entry is edited or after it was removed'''
+        for tag in entry.tags:
+            i = bisect_left(self._tags, tag)
+            if i < len(self._tags) and self._tags[i] == tag:
+                del self._tags[i]
+            self._entries.pop(tag.lower(), None)
+            self.tag_index.remove(tag)
+
+        if entry.tags:
+            self.title_index.remove(entry.tags[0])
+            self.description_index.remove(entry.tags[0])
+
+        self.version += 1
+        for listener in self.listeners:
+            listener(entry)
+
+    def _insert_entry(self, entry: FaqEntry):
+        self._positions[id(entry)] = len(self.data)
+        self.data.append(entry)
+        self._index_entry(entry)
+
+    def _update_entry(self, entry: FaqEntry, new: FaqEntry):
+        self._unindex_entry(entry)
+        entry.tags = new.tags
+        entry.title = new.title
+        entry.description = new.description
+        entry.image = new.image
+        entry.modification_time = new.modification_time
+        self._index_entry(entry)
+
+    def _position(self, entry: FaqEntry) -> int:
+        stored = self._positions[id(entry)]
+        for i in range(min(stored, len(self.data) - 1),
+                       stored - self._removed - 1, -1):
+            if self.data[i] is entry:
+                return i
+
+        raise ValueError(f'{entry.tags} is not part of the faq')
+
+    def _delete_entry(self, entry: FaqEntry):
+        # the order of the entries is kept, it is visible in the downloaded faq file
+        i = self._position(entry)
+        del self.data[i]
+        del self._positions[id(entry)]
+
+        self._removed += 1
+        if self._removed >= self.RENUMBER_AFTER:
+            self._positions = {id(e): i for i, e in enumerate(self.data)}
+            self._removed = 0
+
+        self._unindex_entry(entry)
+
+    def _save(self, record: dict):
+        if self.storage is not None:
+            self.storage.record(record)
+
+    async def retrieve(self, query: str, limit: int = 32) -> list[str] | None:
+        '''
+        Searches titles and descriptions with the storage backend
+
+        :param query: The text to search for
+        :type query: str
+        :param limit: The maximal amount of results, defaults to 32
+        :type limit: int, optional
+        :return: The first tags of the found entries, or None if the backend does not support searching
+        :rtype: list[str] | None
+        '''
+        if self.storage is None:
+            return None
+
+        return await self.storage.search(query, limit)
 
     async def add_faq(self,
                       tags: List[str],
@@ -63,20 +216,21 @@ class FaqUtil:
         :type description: str | None, optional
         :param image: The image link to add, defaults to None
         :type image: str | None, optional
-        :return: The created Entry or None if one of the tags already exists
+        :return: The created Entry or None if there are no tags or one of the tags already exists
         :rtype: FaqEntry
         '''
-        if any(tag in self.get_all_tags(-1) for tag in tags):
+        tags = clean_tags(tags)
+        if not tags or any(tag in self._entries for tag in tags):
             return None
-        entry = FaqEntry(tags=[tag.lower() for tag in tags],
+        entry = FaqEntry(tags=tags,
                          title=title,
                          description=description,
                          image=image,
                          modification_time=int(discord.utils.utcnow().timestamp()))
-        self.data.append(entry)
+        self._insert_entry(entry)
 
         # save faq
-        await self.save_faq(self.path)
+        self._save({'op': 'add', 'entry': asdict(entry)})
 
         return entry
 
@@ -89,9 +243,7 @@ class FaqUtil:
         :return: The found entry or None if nothing was found
         :rtype: FaqEntry | None
         '''
-        for entry in self.data:
-            if tag in entry.tags:
-                return entry
+        return self._entries.get(tag.lower())
 
     async def edit_faq(self,
                        old_tags: list[str],
@@ -117,21 +269,30 @@ class FaqUtil:
         '''
         # search entry
         entry = self.get_faq(old_tags[0])
+        new_tags = clean_tags(new_tags)
 
-        # either there is no entry OR any of the tags, that are completely newly added do already exist
-        if entry is None or any(
-                tag in self.get_all_tags(-1)
-                for tag in [x for x in new_tags if x not in old_tags]):
+        # either there is no entry OR there are no new tags OR any of the new tags does already belong to another entry
+        if entry is None or not new_tags or any(
+                self._entries.get(tag, entry) is not entry
+                for tag in new_tags):
             return
 
         # edit entry and save
-        entry.tags = [tag.lower() for tag in new_tags]
-        entry.title = title
-        entry.description = description
-        entry.image = image
-        entry.modification_time = int(discord.utils.utcnow().timestamp())
+        tag = entry.tags[0]
+        self._update_entry(
+            entry,
+            FaqEntry(tags=new_tags,
+                     title=title,
+                     description=description,
+                     image=image,
+                     modification_time=int(
+                         discord.utils.utcnow().timestamp())))
 
-        await self.save_faq(self.path)
+        self._save({
+            'op': 'edit',
+            'tag': tag,
+            'entry': asdict(entry)
+        })
 
         return entry
 
@@ -144,26 +305,28 @@ class FaqUtil:
         :return: The deleted entry or None if nothing was found and deleted
         :rtype: FaqEntry | None
         '''
-        for entry in self.data:
-            if tag in entry.tags:
-                self.data.remove(entry)
+        entry = self.get_faq(tag)
+        if entry is None:
+            return
 
-                # save faq
-                await self.save_faq(self.path)
+        self._delete_entry(entry)
 
-                return entry
+        # save faq
+        self._save({'op': 'remove', 'tag': tag})
 
-    def download_faq(self) -> discord.File:
+        return entry
+
+    async def download_faq(self) -> discord.File:
         '''
-        Downloads the FAQ-File
+        Downloads the FAQ-File, after all changes were written to it
 
         :return: The FAQ-File
         :rtype: discord.File
         '''
-        faq_path = os.path.join(os.getcwd(), self.path)
+        path = await self.storage.export() if self.storage else self.path
+        faq_path = os.path.join(os.getcwd(), path)
         return discord.File(faq_path)
 
-    @lru_cache(60)
     def get_all_tags(self, amount: int, offset: int = 0) -> list[str]:
         '''
         Returns a list of all tags
@@ -175,10 +338,29 @@ class FaqUtil:
         :return: A list of all tags
         :rtype: list[str]
         '''
-        tags = sorted([t for e in self.data for t in e.tags])
         if amount == -1:
-            return tags
+            return self._tags[offset:]
+
+        return self._tags[offset:offset + amount]
+
+    def get_tags_by_prefix(self, prefix: str, amount: int) -> list[str]:
+        '''
+        Returns the tags starting with a prefix in alphabetical order
+
+        :param prefix: The prefix of the tags
+        :type prefix: str
+        :param amount: The maximal amount of tags that need to be returned
+        :type amount: int
+        :return: A list of the tags starting with the prefix
+        :rtype: list[str]
+        '''
+        prefix = prefix.lower()
+        out: list[str] = []
 
-        tags = tags[offset:offset + amount:]
+        # all tags with the prefix follow each other in the sorted list
+        for i in range(bisect_left(self._tags, prefix), len(self._tags)):
+            if len(out) >= amount or not self._tags[i].startswith(prefix):
+                break
+            out.append(self._tags[i])
 
-        return tags
+        return out
@@ -0,0 +1,495 @@
+'''
+Storage backends for the faq
+'''
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+from dataclasses import asdict
+from functools import partial
+from typing import Callable
+
+import aiofiles
+import json5 as json
+from dataclass_wizard import fromdict, fromlist
+
+from classes.faq import FaqEntry
+from utils.persistence import write_atomic, writer
+from utils.text import normalize
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def dump_faq(data: list[FaqEntry]) -> str:
+    '''
+    Serializes all entries in the format of the faq file
+
+    :param data: The entries to serialize
+    :type data: list[FaqEntry]
+    :return: The content of the faq file
+    :rtype: str
+    '''
+    return json.dumps(  # type: ignore
+        [asdict(i) for i in data],
+        ensure_ascii=True,
+        indent=4,
+        quote_keys=True,
+        trailing_commas=False)
+
+
+class FaqStorage(ABC):
+    '''
+    Base class for storing the faq
+
+    Changes are passed as records: `{'op': 'add', 'entry': {...}}`, `{'op': 'edit', 'tag': old_tag, 'entry': {...}}` or `{'op': 'remove', 'tag': tag}`
+    '''
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        # the list of entries returned by `load`, which is changed in place by FaqUtil
+        self.data: list[FaqEntry] = []
+
+    @abstractmethod
+    async def load(self) -> list[FaqEntry]:
+        '''
+        Loads all entries
+
+        :return: The entries
+        :rtype: list[FaqEntry]
+        '''
+
+    @abstractmethod
+    def record(self, record: dict):
+        '''
+        Schedules saving a change, which was already applied to `data`
+
+        :param record: The change
+        :type record: dict
+        '''
+
+    @abstractmethod
+    async def export(self) -> str:
+        '''
+        Writes all entries in the format of the faq file
+
+        :return: The path of the written file
+        :rtype: str
+        '''
+
+    async def search(self, query: str, limit: int) -> list[str] | None:
+        '''
+        Searches titles and descriptions
+
+        :param query: The text to search for
+        :type query: str
+        :param limit: The maximal amount of results
+        :type limit: int
+        :return: The first tags of the found entries, or None if the backend does not support searching
+        :rtype: list[str] | None
+        '''
+        return None
+
+
+class JsonFaqStorage(FaqStorage):
+    '''
+    Stores the faq in a json file
+
+    Every change is appended as one line to a journal next to the faq file.
+    The journal is written in the background and merged into the faq file once it reaches `JOURNAL_COMPACT_SIZE` bytes.
+    '''
+    JOURNAL_COMPACT_SIZE = 64 * 1024
+
+    def __init__(self, path: str) -> None:
+        super().__init__(path)
+
+        self.journal_path = f'{path}.journal'
+        # the journal starts with the hash of the faq file it belongs to
+        # if the hashes do not match, the journal was already merged into the file
+        self._file_hash = ''
+        self._journal_size = 0
+        # changes which are not yet written to the journal
+        self._pending: list[dict] = []
+        self._journal_lock = asyncio.Lock()
+        self._compaction: asyncio.Task | None = None
+
+    async def load(self) -> list[FaqEntry]:
+        try:
+            async with aiofiles.open(self.path, 'r', encoding='utf-8') as f:
+                text = await f.read()
+        except FileNotFoundError:
+            # faq does not exist, create file
+            print(f'No {self.path}-file found, creating new one...')
+            text = '[]'
+            await write_atomic(self.path, text)
+
+        self._file_hash = _hash(text)
+        self.data = [
+            *fromlist(FaqEntry, json.loads(text or '[]'))  # type: ignore
+        ]
+        await self._replay_journal()
+
+        return self.data
+
+    async def _replay_journal(self):
+        '''Applies all changes from the journal, which are not yet in the faq file'''
+        try:
+            async with aiofiles.open(self.journal_path, 'r',
+                                     encoding='utf-8') as f:
+                lines = (await f.read()).splitlines()
+        except FileNotFoundError:
+            return
+
+        records: list[dict] = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # a change was not completely written before a crash, the changes after it are still valid
+                continue
+
+        if not records or records[0].get('file') != self._file_hash:
+            # the journal was already merged into the faq file, it is replaced on the next change
+            return
+
+        entries = {tag.lower(): e for e in self.data for tag in e.tags}
+        # ids of the removed entries, they are dropped together at the end without changing the order
+        removed: set[int] = set()
+        for record in records[1:]:
+            if record['op'] == 'add':
+                entry = fromdict(FaqEntry, record['entry'])  # type: ignore
+                self.data.append(entry)
+                entries.update((tag.lower(), entry) for tag in entry.tags)
+                continue
+
+            entry = entries.get(record['tag'].lower())
+            if entry is None:
+                continue
+
+            for tag in entry.tags:
+                entries.pop(tag.lower(), None)
+
+            if record['op'] == 'edit':
+                new = fromdict(FaqEntry, record['entry'])  # type: ignore
+                entry.tags = new.tags
+                entry.title = new.title
+                entry.description = new.description
+                entry.image = new.image
+                entry.modification_time = new.modification_time
+                entries.update((tag.lower(), entry) for tag in entry.tags)
+            elif record['op'] == 'remove':
+                removed.add(id(entry))
+
+        if removed:
+            self.data[:] = [e for e in self.data if id(e) not in removed]
+
+        self._journal_size = sum(len(line) + 1 for line in lines)
+
+        # remove the broken lines
+        if len(records) != len(lines):
+            await self.compact()
+
+    def record(self, record: dict):
+        self._pending.append(record)
+        writer.mark_dirty(self.journal_path, self._write_journal)
+
+    async def _write_journal(self):
+        '''Appends all pending changes to the journal and starts merging the journal into the faq file if it got too big'''
+        async with self._journal_lock:
+            if not self._pending:
+                return
+
+            records = list(self._pending)
+            lines = records
+            if self._journal_size == 0:
+                # start a new journal
+                lines = [{'file': self._file_hash}, *records]
+
+            text = ''.join(
+                json.dumps(line, ensure_ascii=True, quote_keys=True) +
+                '\n' for line in lines)  # type: ignore
+
+            try:
+                async with aiofiles.open(self.journal_path,
+                                         'a' if self._journal_size else 'w',
+                                         encoding='utf-8',
+                                         newline='') as f:
+                    # removes the rest of a failed write, so the replay does not stop at a broken line
+                    await f.truncate(self._journal_size)
+                    await f.write(text)
+            except OSError as ex:
+                # the records are kept and written with the next change
+                print(f'Failed to write the faq journal {self.journal_path}: {ex}')
+                return
+
+            self._journal_size += len(text)
+            # records added while writing are kept
+            self._pending = self._pending[len(records):]
+
+        if self._journal_size >= self.JOURNAL_COMPACT_SIZE and (
+                self._compaction is None or self._compaction.done()):
+            self._compaction = asyncio.create_task(self.compact())
+
+    async def compact(self):
+        '''Merges the journal into the faq file and starts a new journal'''
+        async with self._journal_lock:
+            # pending changes are already part of the data
+            self._pending = []
+
+            text = dump_faq(self.data)
+            await write_atomic(self.path, text)
+            self._file_hash = _hash(text)
+            self._journal_size = 0
+
+            # a crash before this point is fine, the old journal does not belong to the new file
+            try:
+                os.remove(self.journal_path)
+            except FileNotFoundError:
+                pass
+
+    async def export(self) -> str:
+        await self.compact()
+        return self.path
+
+
+class SqliteFaqStorage(FaqStorage):
+    '''
+    Stores the faq in a sqlite database, titles and descriptions are searchable with FTS5
+
+    On the first start, the entries of the json faq file are imported. The import is recorded in the
+    `user_version` of the database, so an empty faq stays empty after a restart.
+    '''
+    # the user_version of a database, which already imported the json faq file
+    IMPORTED_VERSION = 1
+
+    SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS faq (
+        id INTEGER PRIMARY KEY,
+        title TEXT NOT NULL,
+        description TEXT,
+        image TEXT,
+        modification_time INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS tags (
+        tag TEXT PRIMARY KEY COLLATE NOCASE,
+        faq_id INTEGER NOT NULL REFERENCES faq(id) ON DELETE CASCADE,
+        position INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS tags_faq_id ON tags(faq_id, position);
+    CREATE VIRTUAL TABLE IF NOT EXISTS faq_fts USING fts5(
+        title, description, content='faq', content_rowid='id'
+    );
+    CREATE TRIGGER IF NOT EXISTS faq_insert AFTER INSERT ON faq BEGIN
+        INSERT INTO faq_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END;
+    CREATE TRIGGER IF NOT EXISTS faq_delete AFTER DELETE ON faq BEGIN
+        INSERT INTO faq_fts(faq_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END;
+    CREATE TRIGGER IF NOT EXISTS faq_update AFTER UPDATE ON faq BEGIN
+        INSERT INTO faq_fts(faq_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO faq_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END;
+    '''
+
+    def __init__(self, path: str, json_path: str) -> None:
+        '''
+        :param path: The path of the database
+        :type path: str
+        :param json_path: The path of the json faq file, used for importing and exporting
+        :type json_path: str
+        '''
+        super().__init__(path)
+        self.json_path = json_path
+
+        self._connection: sqlite3.Connection | None = None
+        # changes which are not yet written to the database
+        self._pending: list[dict] = []
+        self._lock = asyncio.Lock()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            # the connection is used by one worker thread at a time, guarded by the lock
+            self._connection = sqlite3.connect(self.path,
+                                               check_same_thread=False)
+            self._connection.execute('PRAGMA foreign_keys = ON')
+            self._connection.executescript(self.SCHEMA)
+
+        return self._connection
+
+    def _insert(self, entry: FaqEntry):
+        cursor = self.connection.execute(
+            'INSERT INTO faq (title, description, image, modification_time) VALUES (?, ?, ?, ?)',
+            (entry.title, entry.description, entry.image,
+             entry.modification_time))
+        self.connection.executemany(
+            'INSERT INTO tags (tag, faq_id, position) VALUES (?, ?, ?)',
+            [(tag, cursor.lastrowid, i) for i, tag in enumerate(entry.tags)])
+
+    def _load(self) -> list[FaqEntry]:
+        entries: dict[int, FaqEntry] = {}
+        for id, title, description, image, modification_time in self.connection.execute(
+                'SELECT id, title, description, image, modification_time FROM faq ORDER BY id'
+        ):
+            entries[id] = FaqEntry(tags=[],
+                                   title=title,
+                                   description=description,
+                                   image=image,
+                                   modification_time=modification_time)
+
+        for tag, faq_id in self.connection.execute(
+                'SELECT tag, faq_id FROM tags ORDER BY faq_id, position'):
+            entries[faq_id].tags.append(tag)
+
+        return list(entries.values())
+
+    def _is_imported(self) -> bool:
+        return self.connection.execute(
+            'PRAGMA user_version').fetchone()[0] >= self.IMPORTED_VERSION
+
+    async def load(self) -> list[FaqEntry]:
+        async with self._lock:
+            self.data = await asyncio.to_thread(self._load)
+            imported = await asyncio.to_thread(self._is_imported)
+
+        if not imported:
+            data: list[FaqEntry] = []
+            # databases created before the marker existed already contain the faq
+            if not self.data and os.path.exists(self.json_path):
+                # import the json faq file
+                print(f'Importing {self.json_path} into {self.path}...')
+                data = await JsonFaqStorage(self.json_path).load()
+
+            async with self._lock:
+                await asyncio.to_thread(self._import, data)
+                if data:
+                    self.data = data
+
+        return self.data
+
+    def _savepoint(self, change: Callable[[], None], description: str):
+        '''Runs a change in its own savepoint, so a change, which breaks a constraint, does not roll back the others'''
+        self.connection.execute('SAVEPOINT change')
+        try:
+            change()
+        except sqlite3.IntegrityError as ex:
+            # the change can never be written, e.g. it has a tag of another entry
+            self.connection.execute('ROLLBACK TO change')
+            print(f'Skipped {description}, '
+                  f'it cannot be written to {self.path}: {ex}')
+        self.connection.execute('RELEASE change')
+
+    def _import(self, data: list[FaqEntry]):
+        with self.connection:
+            self.connection.execute('BEGIN')
+            for entry in data:
+                self._savepoint(partial(self._insert, entry),
+                                f'the faq {entry.tags}')
+            # pragmas do not accept parameters
+            self.connection.execute(
+                f'PRAGMA user_version = {self.IMPORTED_VERSION}')
+
+    def _apply_record(self, record: dict):
+        if record['op'] == 'add':
+            self._insert(fromdict(FaqEntry, record['entry']))  # type: ignore
+            return
+
+        row = self.connection.execute('SELECT faq_id FROM tags WHERE tag = ?',
+                                      (record['tag'], )).fetchone()
+        if row is None:
+            return
+
+        if record['op'] == 'remove':
+            self.connection.execute('DELETE FROM faq WHERE id = ?', row)
+        elif record['op'] == 'edit':
+            entry = fromdict(FaqEntry, record['entry'])  # type: ignore
+            self.connection.execute(
+                'UPDATE faq SET title = ?, description = ?, image = ?, modification_time = ? WHERE id = ?',
+                (entry.title, entry.description, entry.image,
+                 entry.modification_time, row[0]))
+            self.connection.execute('DELETE FROM tags WHERE faq_id = ?', row)
+            self.connection.executemany(
+                'INSERT INTO tags (tag, faq_id, position) VALUES (?, ?, ?)',
+                [(tag, row[0], i) for i, tag in enumerate(entry.tags)])
+
+    def _apply(self, records: list[dict]):
+        # all records are written in one transaction, errors like a locked database roll back all of them
+        with self.connection:
+            self.connection.execute('BEGIN')
+            for record in records:
+                self._savepoint(partial(self._apply_record, record),
+                                f'the change {record}')
+
+    def record(self, record: dict):
+        self._pending.append(record)
+        writer.mark_dirty(self.path, self._write)
+
+    async def _write(self):
+        async with self._lock:
+            records = list(self._pending)
+            if not records:
+                return
+
+            try:
+                # the transaction is rolled back if a record fails
+                await asyncio.to_thread(self._apply, records)
+            except Exception as ex:
+                # the records are kept and written with the next change
+                print(f'Failed to write the faq to {self.path}: {ex}')
+                return
+
+            # records added while writing are kept
+            self._pending = self._pending[len(records):]
+
+    async def export(self) -> str:
+        await self._write()
+        await write_atomic(self.json_path, dump_faq(self.data))
+        return self.json_path
+
+    def _search(self, query: str, limit: int) -> list[str]:
+        return [
+            row[0] for row in self.connection.execute(
+                'SELECT tags.tag FROM faq_fts JOIN tags ON tags.faq_id = faq_fts.rowid AND tags.position = 0 '
+                'WHERE faq_fts MATCH ? ORDER BY rank LIMIT ?', (query, limit))
+        ]
+
+    async def search(self, query: str, limit: int) -> list[str] | None:
+        # every word is quoted, so the message cannot contain FTS5 syntax
+        words = normalize(query).split()
+        if not words:
+            return []
+
+        # changes need to be written before searching
+        if self._pending:
+            await self._write()
+
+        async with self._lock:
+            return await asyncio.to_thread(
+                self._search, ' OR '.join(f'"{word}"' for word in words),
+                limit)
+
+
+def create_storage(path: str, backend: str = 'json') -> FaqStorage:
+    '''
+    Creates the storage for a faq file
+
+    :param path: The path of the json faq file
+    :type path: str
+    :param backend: Either `json` or `sqlite`. The sqlite database is stored next to the json file, defaults to 'json'
+    :type backend: str, optional
+    :return: The storage
+    :rtype: FaqStorage
+    '''
+    if backend == 'json':
+        return JsonFaqStorage(path)
+    if backend == 'sqlite':
+        return SqliteFaqStorage(f'{os.path.splitext(path)[0]}.db', path)
+
+    raise ValueError(f'Unknown faq storage {backend}, use json or sqlite')
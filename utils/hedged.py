@@ -0,0 +1,225 @@
+'''
+Util for sending requests to several equivalent hosts with a deadline, retries and hedging
+'''
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+import aiohttp
+
+from utils.http import LatencyHistogram
+
+# seconds a host is tried last after it failed
+DOWN_SECONDS = 60
+
+
+@dataclass
+class HedgeStats:
+    requests: int = 0
+    # attempts on another host after an attempt failed
+    retries: int = 0
+    # attempts on another host, because the first one was slower than usual
+    hedges: int = 0
+    # requests answered by the hedged attempt
+    hedge_wins: int = 0
+    deadline_exceeded: int = 0
+    failed: int = 0
+    # latency of whole requests, including retries, hedges, failures and deadline expiries
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+    # latency of single successful attempts, which decides when to hedge
+    attempt_latency: LatencyHistogram = field(
+        default_factory=LatencyHistogram)
+    # time single attempts ran until they failed or were cancelled (lost to another attempt or at the deadline)
+    # kept apart, because a hedge delay from these would grow with every slow host it should hedge against
+    abandoned_latency: LatencyHistogram = field(
+        default_factory=LatencyHistogram)
+
+    def __str__(self) -> str:
+        return (f'requests: {self.requests}\n'
+                f'retries: {self.retries}\n'
+                f'hedges: {self.hedges} ({self.hedge_wins} won)\n'
+                f'deadline exceeded: {self.deadline_exceeded}\n'
+                f'failed: {self.failed}\n'
+                f'abandoned attempts: {self.abandoned_latency.total}\n'
+                f'{self.latency}')
+
+
+def _retrieve_exception(task: asyncio.Task):
+    # attempts, which lost or were too late, are not awaited anymore
+    if not task.cancelled():
+        task.exception()
+
+
+class HedgedClient:
+    '''
+    Posts json to the first available of several hosts, which serve the same api
+
+    Every request has a deadline. Failed attempts (connection errors, timeouts and 5xx responses) are retried
+    on the next host. With hedging, a second host is also asked if the first one did not answer within the
+    usual (p95) latency, and the first answer wins.
+    '''
+
+    def __init__(self,
+                 get_session: Callable[[], aiohttp.ClientSession],
+                 hosts: list[str],
+                 headers: dict[str, str] | None = None,
+                 deadline: float = 2.5,
+                 hedge: bool = True,
+                 hedge_quantile: float = 0.95,
+                 min_hedge_delay: float = 0.05) -> None:
+        '''
+        :param get_session: The function, which returns the session for the requests
+        :type get_session: Callable[[], aiohttp.ClientSession]
+        :param hosts: The base urls of the hosts, in the order they are tried
+        :type hosts: list[str]
+        :param headers: The headers of every request, defaults to None
+        :type headers: dict[str, str] | None, optional
+        :param deadline: The seconds a request may take in total, defaults to 2.5
+        :type deadline: float, optional
+        :param hedge: If a second host is asked when the first one is slow, defaults to True
+        :type hedge: bool, optional
+        :param hedge_quantile: The quantile of the latency, after which the second host is asked, defaults to 0.95
+        :type hedge_quantile: float, optional
+        :param min_hedge_delay: The minimal seconds before the second host is asked, defaults to 0.05
+        :type min_hedge_delay: float, optional
+        '''
+        if not hosts:
+            raise ValueError('At least one host is required')
+
+        self.get_session = get_session
+        self.hosts = hosts
+        self.headers = headers or {}
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.min_hedge_delay = min_hedge_delay
+
+        self.stats = HedgeStats()
+        self._down_until: dict[str, float] = {}
+
+    def hedge_delay(self) -> float:
+        '''
+        Gets the seconds after which a second host is asked
+
+        :return: The observed latency quantile, limited to between `min_hedge_delay` and half the deadline
+        :rtype: float
+        '''
+        delay = self.stats.attempt_latency.quantile(self.hedge_quantile)
+        if delay is None:
+            # nothing observed yet
+            delay = self.deadline / 4
+        return min(max(delay, self.min_hedge_delay), self.deadline / 2)
+
+    def _is_down(self, host: str) -> bool:
+        return self._down_until.get(host, 0) > time.monotonic()
+
+    def _ordered_hosts(self) -> list[str]:
+        # hosts, which failed recently, are tried last
+        return sorted(self.hosts, key=self._is_down)
+
+    async def _attempt(self, url: str, data: dict, timeout: float) -> Any:
+        async with self.get_session().post(
+                url,
+                headers=self.headers,
+                json=data,
+                timeout=aiohttp.ClientTimeout(total=timeout),
+        ) as ans:
+            ans.raise_for_status()
+            return await ans.json()
+
+    async def post(self,
+                   path: str,
+                   data: dict,
+                   deadline: float | None = None) -> Any:
+        '''
+        Posts json to the hosts until one answers or the deadline is reached
+
+        :param path: The path of the api endpoint
+        :type path: str
+        :param data: The json body
+        :type data: dict
+        :param deadline: The seconds the request may take, defaults to `deadline` of the client
+        :type deadline: float | None, optional
+        :raises asyncio.TimeoutError: If no host answered before the deadline
+        :raises aiohttp.ClientResponseError: If a host rejected the request (4xx) or all hosts failed with 5xx
+        :raises aiohttp.ClientError: If all hosts failed
+        :return: The decoded json answer
+        :rtype: Any
+        '''
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        end = start + (deadline if deadline is not None else self.deadline)
+        hosts = self._ordered_hosts()
+        # host, start and if it is the hedged attempt of every running attempt
+        pending: dict[asyncio.Task, tuple[str, float, bool]] = {}
+        hedged = False
+        error: BaseException | None = None
+        self.stats.requests += 1
+
+        def launch(is_hedge: bool):
+            host = hosts.pop(0)
+            task = asyncio.create_task(
+                self._attempt(f'{host}{path}', data, end - loop.time()))
+            task.add_done_callback(_retrieve_exception)
+            pending[task] = (host, loop.time(), is_hedge)
+
+        try:
+            while True:
+                if not pending:
+                    if not hosts:
+                        self.stats.failed += 1
+                        raise error  # type: ignore
+                    if error is not None:
+                        self.stats.retries += 1
+                    launch(False)
+
+                remaining = end - loop.time()
+                if remaining <= 0:
+                    self.stats.deadline_exceeded += 1
+                    raise asyncio.TimeoutError(
+                        f'No answer for {path} within the deadline')
+
+                # hosts, which failed recently, are only used for retries
+                can_hedge = (self.hedge and not hedged and hosts
+                             and not self._is_down(hosts[0]))
+                timeout = min(remaining,
+                              self.hedge_delay()) if can_hedge else remaining
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    if can_hedge and loop.time() < end:
+                        hedged = True
+                        self.stats.hedges += 1
+                        launch(True)
+                    continue
+
+                for task in done:
+                    host, attempt_start, is_hedge = pending.pop(task)
+                    if (ex := task.exception()) is None:
+                        self.stats.attempt_latency.observe(loop.time() -
+                                                           attempt_start)
+                        if is_hedge:
+                            self.stats.hedge_wins += 1
+                        return task.result()
+
+                    self.stats.abandoned_latency.observe(loop.time() -
+                                                         attempt_start)
+                    if isinstance(ex, aiohttp.ClientResponseError
+                                  ) and ex.status < 500:
+                        # the request itself is wrong, other hosts would reject it too
+                        self.stats.failed += 1
+                        raise ex
+
+                    error = ex
+                    self._down_until[host] = time.monotonic() + DOWN_SECONDS
+        finally:
+            self.stats.latency.observe(loop.time() - start)
+            for task, (_, attempt_start, _) in pending.items():
+                self.stats.abandoned_latency.observe(loop.time() -
+                                                     attempt_start)
+                task.cancel()
@@ -0,0 +1,145 @@
+'''
+Util for creating long-lived aiohttp sessions, which reuse their connections
+'''
+
+from bisect import bisect_left
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+import aiohttp
+
+
+@dataclass
+class HttpStats:
+    # every sent request, including the failed ones
+    requests: int = 0
+    # requests, which raised an exception (e.g. connection errors and timeouts)
+    failed: int = 0
+    # new tcp (and tls) connections
+    connections_created: int = 0
+    # requests sent over a kept-alive connection
+    connections_reused: int = 0
+    dns_cache_hits: int = 0
+    dns_cache_misses: int = 0
+
+    def __str__(self) -> str:
+        return (f'requests: {self.requests} ({self.failed} failed)\n'
+                f'connections created: {self.connections_created}\n'
+                f'connections reused: {self.connections_reused}\n'
+                f'dns cache: {self.dns_cache_hits} hits, '
+                f'{self.dns_cache_misses} misses')
+
+
+def _create_trace_config(stats: HttpStats) -> aiohttp.TraceConfig:
+
+    def count(field: str):
+
+        async def on_signal(session: aiohttp.ClientSession,
+                            context: SimpleNamespace, params):
+            setattr(stats, field, getattr(stats, field) + 1)
+
+        return on_signal
+
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(count('requests'))
+    trace.on_request_exception.append(count('failed'))
+    trace.on_connection_create_end.append(count('connections_created'))
+    trace.on_connection_reuseconn.append(count('connections_reused'))
+    trace.on_dns_cache_hit.append(count('dns_cache_hits'))
+    trace.on_dns_cache_miss.append(count('dns_cache_misses'))
+    return trace
+
+
+def create_session(stats: HttpStats,
+                   limit_per_host: int = 8,
+                   keepalive: float = 60,
+                   dns_ttl: int = 300,
+                   timeout: float = 10) -> aiohttp.ClientSession:
+    '''
+    Creates a session, which keeps its connections alive and caches dns lookups
+
+    The session has to be closed with `await session.close()`
+
+    :param stats: The statistics, which are updated by every request of the session
+    :type stats: HttpStats
+    :param limit_per_host: The maximum amount of simultaneous connections to one host, defaults to 8
+    :type limit_per_host: int, optional
+    :param keepalive: The seconds an idle connection is kept open, defaults to 60
+    :type keepalive: float, optional
+    :param dns_ttl: The seconds a dns lookup is cached, defaults to 300
+    :type dns_ttl: int, optional
+    :param timeout: The seconds a request may take, defaults to 10
+    :type timeout: float, optional
+    :return: The new session
+    :rtype: aiohttp.ClientSession
+    '''
+    connector = aiohttp.TCPConnector(
+        limit=4 * limit_per_host,
+        limit_per_host=limit_per_host,
+        keepalive_timeout=keepalive,
+        ttl_dns_cache=dns_ttl,
+    )
+
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=timeout),
+        trace_configs=[_create_trace_config(stats)],
+    )
+
+
+class LatencyHistogram:
+    '''
+    Counts durations in exponentially growing buckets, which is enough to estimate the tail latency
+    '''
+
+    # upper bounds of the buckets in seconds, the last bucket contains everything slower
+    BOUNDS = (0.01, 0.025, 0.05, 0.1, 0.15, 0.25, 0.4, 0.6, 1, 1.5, 2.5, 4,
+              10)
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.total = 0
+
+    def observe(self, seconds: float):
+        '''
+        Adds a duration
+
+        :param seconds: The duration
+        :type seconds: float
+        '''
+        self.counts[bisect_left(self.BOUNDS, seconds)] += 1
+        self.total += 1
+
+    def quantile(self, q: float) -> float | None:
+        '''
+        Estimates a quantile as the upper bound of the bucket, which contains it
+
+        :param q: The quantile, e.g. 0.95
+        :type q: float
+        :return: The estimated duration in seconds, None if nothing was observed
+        :rtype: float | None
+        '''
+        if not self.total:
+            return None
+
+        rank = q * self.total
+        seen = 0
+        for bound, count in zip((*self.BOUNDS, float('inf')), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound if bound != float('inf') else self.BOUNDS[-1]
+
+        return self.BOUNDS[-1]
+
+    def __str__(self) -> str:
+        if not self.total:
+            return 'no requests'
+
+        quantiles = ', '.join(
+            f'p{int(q * 100)} <= {self.quantile(q) * 1000:.0f} ms'  # type: ignore
+            for q in (0.5, 0.95, 0.99))
+        buckets = '\n'.join(
+            f'<= {bound * 1000:>5.0f} ms: {count}'
+            for bound, count in zip((*self.BOUNDS, float('inf')), self.counts)
+            if count)
+        return f'{quantiles}\n{buckets}'
@@ -0,0 +1,313 @@
+'''
+Util for running the fuzzy faq matching outside of the event loop
+'''
+
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Callable, TypeVar
+
+from utils.cache import TTLCache
+from utils.faq import FaqSnapshot, FaqUtil
+from utils.ngram import NgramIndex
+from utils.scorer import SCORERS
+from utils.text import normalize
+
+T = TypeVar('T')
+
+# minimum scores for tags, titles and descriptions
+PERCENTAGES = (85, 75, 65)
+# minimum bm25 scores (relative to the best possible score) for titles and descriptions
+BM25_SCORES = (0.6, 0.5)
+
+ENGINES = ('fuzzy', 'bm25')
+
+
+def match_message(snapshot: FaqSnapshot,
+                  content: str,
+                  retrieved: list[str] | None = None,
+                  engine: str = 'fuzzy',
+                  scorer: str = 'thefuzz') -> str | None:
+    '''
+    Searches the faq for a message. Tags are searched first, then titles and then descriptions
+
+    :param snapshot: The faq data to search
+    :type snapshot: FaqSnapshot
+    :param content: The message to search for
+    :type content: str
+    :param retrieved: The first tags of the entries found by the storage backend, defaults to None
+    :type retrieved: list[str] | None, optional
+    :param engine: `fuzzy` to score titles and descriptions with thefuzz, `bm25` to score them with bm25, defaults to 'fuzzy'
+    :type engine: str, optional
+    :param scorer: The backend, which scores the fuzzy tiers (see `SCORERS`), defaults to 'thefuzz'
+    :type scorer: str, optional
+    :return: The tag of the matching entry or None if nothing matched good enough
+    :rtype: str | None
+    '''
+    content = normalize(content)
+    fuzzy = SCORERS[scorer]
+
+    if engine == 'bm25':
+        res = fuzzy.extract(content, _get_choices(snapshot.tag_index, content,
+                                                  None), 1)
+        if res and res[0][1] >= PERCENTAGES[0]:
+            return res[0][0]
+
+        # every title and description is scored at once
+        for bm25, minimum in zip(
+            (snapshot.title_bm25, snapshot.description_bm25), BM25_SCORES):
+            if (top := bm25.top(content)) is not None and top[1] >= minimum:
+                return top[0]
+
+        return None
+
+    # the choices are only collected when the scorer needs them,
+    # batch scorers score the whole cascade at once and the others stop at the first match
+    tiers = (_get_choices(index, content, tier_retrieved)
+             for index, tier_retrieved in (
+                 (snapshot.tag_index, None),
+                 (snapshot.title_index, retrieved),
+                 (snapshot.description_index, retrieved),
+             ))
+
+    for res, percentage in zip(fuzzy.extract_cascade(content, tiers, 1),
+                               PERCENTAGES):
+        if res and res[0][1] >= percentage:
+            return res[0][0]
+
+
+def _get_choices(index: NgramIndex[str], content: str,
+                 retrieved: list[str] | None) -> dict[str, str]:
+    # only score the candidates which share n-grams with the message
+    choices = index.candidates(content)
+
+    if retrieved:
+        # texts found by the storage backend are added to the candidates,
+        # so a hit on a common word cannot hide the best candidate
+        for key in retrieved:
+            if key not in choices and (text := index.get_normalized(key)):
+                choices[key] = text
+
+    return choices
+
+
+def autocomplete_tags(snapshot: FaqSnapshot,
+                      value: str,
+                      limit: int = 10,
+                      scorer: str = 'thefuzz') -> list[str]:
+    '''
+    Gets the nearest tags for an autocomplete value
+
+    :param snapshot: The faq data to search
+    :type snapshot: FaqSnapshot
+    :param value: The value the user typed
+    :type value: str
+    :param limit: The maximal amount of tags, defaults to 10
+    :type limit: int, optional
+    :param scorer: The backend, which scores the tags (see `SCORERS`), defaults to 'thefuzz'
+    :type scorer: str, optional
+    :return: A list of the nearest tags
+    :rtype: list[str]
+    '''
+    res = SCORERS[scorer].extract(normalize(value), snapshot.normalized_tags,
+                                  limit)
+
+    return [tag for tag, score in res if score >= 50]
+
+
+def _timed(func: Callable[..., T], snapshot: FaqSnapshot,
+           *args: Any) -> tuple[T, float]:
+    start = time.perf_counter()
+    return func(snapshot, *args), time.perf_counter() - start
+
+
+# the snapshot of a worker process, set once when the process starts
+_worker_snapshot: FaqSnapshot | None = None
+
+
+def _set_worker_snapshot(snapshot: FaqSnapshot):
+    global _worker_snapshot
+    _worker_snapshot = snapshot
+
+
+def _timed_in_worker(func: Callable[..., T], *args: Any) -> tuple[T, float]:
+    return _timed(func, _worker_snapshot, *args)  # type: ignore
+
+
+@dataclass
+class MatchStats:
+    calls: int = 0
+    timeouts: int = 0
+    # seconds spent matching inside the event loop (inline mode)
+    loop_seconds: float = 0
+    # seconds spent matching in workers, which the event loop saved
+    worker_seconds: float = 0
+    max_seconds: float = 0
+
+
+class FaqMatcher:
+    '''
+    Runs the faq matching either inline, in a thread pool or in a process pool
+
+    Every call gets an immutable snapshot of the faq data and a timeout, so a single message cannot block the bot.
+    Messages without a match are remembered for `unmatched_ttl` seconds, so repeats are not scored again.
+
+    A timed out call cannot be interrupted inside the pool. The pool is replaced instead, so later calls do not
+    queue behind it: processes of the old pool are killed, threads of the old pool finish their call and exit.
+    The inline mode runs on the event loop and has no timeout.
+    '''
+    MODES = ('inline', 'thread', 'process')
+
+    def __init__(self,
+                 faq: FaqUtil,
+                 mode: str = 'thread',
+                 workers: int = 2,
+                 timeout: float = 2,
+                 unmatched_ttl: float = 300,
+                 engine: str = 'fuzzy',
+                 scorer: str = 'thefuzz') -> None:
+        if mode not in self.MODES:
+            raise ValueError(
+                f'Unknown match mode {mode}, use one of {self.MODES}')
+        if engine not in ENGINES:
+            raise ValueError(
+                f'Unknown match engine {engine}, use one of {ENGINES}')
+        if scorer not in SCORERS:
+            raise ValueError(
+                f'Unknown scorer {scorer}, use one of {tuple(SCORERS)}')
+
+        self.faq = faq
+        self.mode = mode
+        self.workers = workers
+        self.timeout = timeout
+        self.engine = engine
+        self.scorer = scorer
+
+        self.stats = MatchStats()
+        # (hash of the normalized message, faq version) of messages without a match
+        self.unmatched: TTLCache[tuple[int, int], bool] = TTLCache(
+            1024, unmatched_ttl)
+        self._executor: Executor | None = None
+        self._executor_version = -1
+
+    def _get_executor(self, snapshot: FaqSnapshot) -> Executor:
+        if self.mode == 'thread':
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    self.workers, thread_name_prefix='faq-matcher')
+            return self._executor
+
+        # processes receive the snapshot once when they start, so the pool is replaced when the faq changed
+        if self._executor is None or self._executor_version != snapshot.version:
+            self.close()
+            self._executor = ProcessPoolExecutor(
+                self.workers,
+                initializer=_set_worker_snapshot,
+                initargs=(snapshot, ),
+            )
+            self._executor_version = snapshot.version
+
+        return self._executor
+
+    async def _run(self, func: Callable[..., T], *args: Any) -> T:
+        snapshot = self.faq.snapshot()
+        self.stats.calls += 1
+
+        if self.mode == 'inline':
+            res, elapsed = _timed(func, snapshot, *args)
+            self.stats.loop_seconds += elapsed
+            self.stats.max_seconds = max(self.stats.max_seconds, elapsed)
+            return res
+
+        executor = self._get_executor(snapshot)
+        if self.mode == 'process':
+            call = partial(_timed_in_worker, func, *args)
+        else:
+            call = partial(_timed, func, snapshot, *args)
+
+        try:
+            res, elapsed = await asyncio.wait_for(
+                asyncio.get_running_loop().run_in_executor(executor, call),
+                self.timeout,
+            )
+        except asyncio.TimeoutError:
+            self.stats.timeouts += 1
+            self._abandon_executor()
+            raise
+        except BrokenProcessPool:
+            # a worker died, the pool will be recreated on the next call
+            self.close()
+            raise
+
+        self.stats.worker_seconds += elapsed
+        self.stats.max_seconds = max(self.stats.max_seconds, elapsed)
+        return res
+
+    async def match(self, content: str) -> str | None:
+        '''
+        Searches the faq for a message
+
+        :param content: The message to search for
+        :type content: str
+        :return: The tag of the matching entry or None if nothing matched or the timeout was reached
+        :rtype: str | None
+        '''
+        key = (hash(normalize(content)), self.faq.version)
+        if self.unmatched.get(key):
+            return None
+
+        # the storage backend can find titles and descriptions, but not misspelled words
+        # if it finds nothing, the n-gram indices are used
+        retrieved = await self.faq.retrieve(
+            content) if self.engine == 'fuzzy' else None
+
+        try:
+            tag = await self._run(match_message, content, retrieved,
+                                  self.engine, self.scorer)
+        except (asyncio.TimeoutError, BrokenProcessPool):
+            return None
+
+        if tag is None:
+            self.unmatched.set(key, True)
+
+        return tag
+
+    async def autocomplete(self,
+                           value: str,
+                           limit: int = 10) -> list[str] | None:
+        '''
+        Gets the nearest tags for an autocomplete value
+
+        :param value: The value the user typed
+        :type value: str
+        :param limit: The maximal amount of tags, defaults to 10
+        :type limit: int, optional
+        :return: A list of the nearest tags, None if the timeout was reached
+        :rtype: list[str] | None
+        '''
+        try:
+            return await self._run(autocomplete_tags, value, limit,
+                                   self.scorer)
+        except (asyncio.TimeoutError, BrokenProcessPool):
+            return None
+
+    def _abandon_executor(self):
+        '''Replaces the pool after a timeout, the running calls of the old pool are stopped if possible'''
+        executor = self._executor
+        # the workers of a process pool are only known until it is shut down
+        processes = list(executor._processes.values()) if isinstance(
+            executor, ProcessPoolExecutor) and executor._processes else []
+
+        self.close()
+        for process in processes:
+            process.kill()
+
+    def close(self):
+        '''Shuts down the workers without waiting for running matches'''
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._executor_version = -1
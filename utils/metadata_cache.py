@@ -0,0 +1,167 @@
+'''
+Util for caching the open graph metadata of wiki pages on disk
+'''
+
+import os
+import time
+from collections import OrderedDict
+from dataclasses import asdict
+
+import aiofiles
+import json5 as json
+from dataclass_wizard import fromdict
+
+from classes.algolia import CachedMetadata
+from utils.persistence import write_atomic, writer
+
+
+class MetadataCache:
+    '''
+    Metadata of wiki pages keyed by their url, which survives restarts
+
+    Entries are used without a request for `fresh_ttl` seconds, then they are revalidated with the stored
+    ETag and Last-Modified headers. The least recently used entries are removed if there are more than `maxsize`.
+    '''
+
+    def __init__(self,
+                 path: str,
+                 data: OrderedDict[str, CachedMetadata],
+                 maxsize: int = 512,
+                 fresh_ttl: float = 3600) -> None:
+        self.path = path
+        self.maxsize = maxsize
+        self.fresh_ttl = fresh_ttl
+        self._data = data
+
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    async def create(cls,
+                     path: str,
+                     maxsize: int = 512,
+                     fresh_ttl: float = 3600) -> 'MetadataCache':
+        '''
+        Creates the cache and loads the entries from the file, if it exists
+
+        :param path: The path of the cache file
+        :type path: str
+        :param maxsize: The maximal amount of entries, defaults to 512
+        :type maxsize: int, optional
+        :param fresh_ttl: The seconds an entry is used without revalidating it, defaults to 3600
+        :type fresh_ttl: float, optional
+        :return: The cache
+        :rtype: MetadataCache
+        '''
+        data: OrderedDict[str, CachedMetadata] = OrderedDict()
+        if os.path.exists(path):
+            try:
+                async with aiofiles.open(path, 'r', encoding='utf-8') as f:
+                    # the file is ordered from the least to the most recently used entry
+                    for url, entry in json.loads(await f.read()).items():
+                        data[url] = fromdict(CachedMetadata, entry)
+            except Exception as ex:
+                # it is only a cache, so the pages are downloaded again
+                print(f'Failed to load the metadata cache {path}: {ex}')
+                data.clear()
+
+        return cls(path, data, maxsize, fresh_ttl)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, url: str) -> CachedMetadata | None:
+        '''
+        Gets the entry of a page and marks it as recently used
+
+        :param url: The url of the page
+        :type url: str
+        :return: The entry or None if the page is not cached
+        :rtype: CachedMetadata | None
+        '''
+        entry = self._data.get(url)
+        if entry is not None:
+            self._data.move_to_end(url)
+        return entry
+
+    def is_fresh(self, entry: CachedMetadata) -> bool:
+        '''
+        Checks if an entry can be used without revalidating it
+
+        :param entry: The entry
+        :type entry: CachedMetadata
+        :return: True if it was checked less than `fresh_ttl` seconds ago
+        :rtype: bool
+        '''
+        return time.time() - entry.checked < self.fresh_ttl
+
+    def headers(self, entry: CachedMetadata | None) -> dict[str, str]:
+        '''
+        Gets the headers of a conditional request, which revalidates an entry
+
+        :param entry: The entry or None if the page is not cached
+        :type entry: CachedMetadata | None
+        :return: The headers, empty if the entry cannot be revalidated
+        :rtype: dict[str, str]
+        '''
+        headers: dict[str, str] = {}
+        if entry is None:
+            return headers
+
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def set(self, url: str, metadata: list[str], etag: str | None,
+            last_modified: str | None):
+        '''
+        Adds or replaces the entry of a downloaded page
+
+        :param url: The url of the page
+        :type url: str
+        :param metadata: The metadata of the page
+        :type metadata: list[str]
+        :param etag: The ETag header of the response
+        :type etag: str | None
+        :param last_modified: The Last-Modified header of the response
+        :type last_modified: str | None
+        '''
+        self._data[url] = CachedMetadata(metadata, etag, last_modified,
+                                         time.time())
+        self._data.move_to_end(url)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+        self._mark_dirty()
+
+    def touch(self, url: str):
+        '''
+        Marks an entry as fresh again, after the server confirmed it did not change
+
+        :param url: The url of the page
+        :type url: str
+        '''
+        if (entry := self._data.get(url)) is not None:
+            entry.checked = time.time()
+            self._mark_dirty()
+
+    def _mark_dirty(self):
+        writer.mark_dirty(self.path, self.save)
+
+    async def save(self):
+        '''Writes all entries to the cache file'''
+        await write_atomic(
+            self.path,
+            json.dumps(  # type: ignore
+                {url: asdict(entry)
+                 for url, entry in self._data.items()},
+                ensure_ascii=True,
+                indent=4,
+                quote_keys=True,
+                trailing_commas=False) + '\n')
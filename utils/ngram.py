@@ -0,0 +1,162 @@
+'''
+Util for narrowing down fuzzy searches with an inverted character n-gram index
+'''
+
+from collections import Counter, defaultdict
+from typing import Generic, Hashable, TypeVar
+
+from utils.text import normalize
+
+K = TypeVar('K', bound=Hashable)
+
+
+class NgramIndex(Generic[K]):
+    '''
+    Inverted index from character n-grams and whole tokens to the texts containing them
+
+    It is used to get a small set of candidates, which are then scored by thefuzz.
+    The normalized form and the tokens of every text are computed once when it is added,
+    so the texts can be scored without running thefuzz's processor again.
+    '''
+
+    def __init__(self, n: int = 3) -> None:
+        self.n = n
+        self._postings: defaultdict[str, set[K]] = defaultdict(set)
+        self._grams: dict[K, set[str]] = {}
+        self._normalized: dict[K, str] = {}
+        self._tokens: dict[K, tuple[str, ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self._normalized)
+
+    def get_normalized(self, key: K) -> str | None:
+        '''
+        Gets the normalized form of an indexed text
+
+        :param key: The key of the text
+        :type key: K
+        :return: The normalized text or None if the key is not indexed
+        :rtype: str | None
+        '''
+        return self._normalized.get(key)
+
+    def normalized(self) -> dict[K, str]:
+        '''
+        Gets the normalized forms of all indexed texts
+
+        :return: The normalized texts as `{key: text}`
+        :rtype: dict[K, str]
+        '''
+        return dict(self._normalized)
+
+    def tokens(self) -> dict[K, tuple[str, ...]]:
+        '''
+        Gets the tokens of all indexed texts
+
+        :return: The tokens as `{key: tokens}`
+        :rtype: dict[K, tuple[str, ...]]
+        '''
+        return dict(self._tokens)
+
+    def copy(self) -> 'NgramIndex[K]':
+        '''
+        Creates an independent copy of the index, which is not affected by later changes
+
+        :return: The copied index
+        :rtype: NgramIndex[K]
+        '''
+        index: NgramIndex[K] = NgramIndex(self.n)
+        for gram, keys in self._postings.items():
+            index._postings[gram] = set(keys)
+
+        # the gram sets and tokens of a key are never changed in place, so they can be shared
+        index._grams = dict(self._grams)
+        index._normalized = dict(self._normalized)
+        index._tokens = dict(self._tokens)
+
+        return index
+
+    def _grams_of(self, tokens: tuple[str, ...]) -> set[str]:
+        out: set[str] = set()
+        for token in tokens:
+            out.add(f'#{token}')
+
+            padded = f' {token} '
+            out.update(padded[i:i + self.n]
+                       for i in range(len(padded) - self.n + 1))
+
+        return out
+
+    def grams(self, text: str | None) -> set[str]:
+        '''
+        Split a text into its tokens and padded character n-grams
+
+        :param text: The text to split
+        :type text: str | None
+        :return: A set of all tokens (prefixed with `#`) and n-grams
+        :rtype: set[str]
+        '''
+        return self._grams_of(tuple(normalize(text).split()))
+
+    def add(self, key: K, text: str | None):
+        '''
+        Adds a text to the index. If the key already exists, the old text is replaced
+
+        :param key: The key, which is returned by `candidates`
+        :type key: K
+        :param text: The text to index. Nothing is indexed if it is None
+        :type text: str | None
+        '''
+        self.remove(key)
+
+        if text is None:
+            return
+
+        normalized = normalize(text)
+        tokens = tuple(normalized.split())
+        grams = self._grams_of(tokens)
+        for gram in grams:
+            self._postings[gram].add(key)
+
+        self._grams[key] = grams
+        self._normalized[key] = normalized
+        self._tokens[key] = tokens
+
+    def remove(self, key: K):
+        '''
+        Removes a text from the index
+
+        :param key: The key of the text
+        :type key: K
+        '''
+        grams = self._grams.pop(key, None)
+        if grams is None:
+            return
+
+        self._normalized.pop(key, None)
+        self._tokens.pop(key, None)
+        for gram in grams:
+            postings = self._postings[gram]
+            postings.discard(key)
+            if not postings:
+                del self._postings[gram]
+
+    def candidates(self, query: str, limit: int = 32) -> dict[K, str]:
+        '''
+        Gets the texts which share the most n-grams with the query
+
+        :param query: The query to search for
+        :type query: str
+        :param limit: The maximum amount of candidates, defaults to 32
+        :type limit: int, optional
+        :return: The normalized candidates as `{key: text}`, ready to be passed to `process.extract` without a processor
+        :rtype: dict[K, str]
+        '''
+        counter: Counter[K] = Counter()
+        for gram in self.grams(query):
+            counter.update(self._postings.get(gram, ()))
+
+        return {
+            key: self._normalized[key]
+            for key, _ in counter.most_common(limit)
+        }
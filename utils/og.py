@@ -0,0 +1,81 @@
+'''
+Util for extracting open graph metadata from the head of a html page, without parsing the whole page
+'''
+
+import codecs
+from html.parser import HTMLParser
+from typing import AsyncIterable
+
+# the fields returned by `AlgoliaUtil.get_metadata`, in this order
+OG_FIELDS = ('og:title', 'og:description', 'og:image', 'og:image:alt',
+             'og:site_name', 'og:url')
+
+
+class OgParser(HTMLParser):
+    '''
+    Collects the open graph `<meta>` tags in one pass and marks itself as done at the end of `<head>`
+
+    Tags with a `name` or a `property` attribute are accepted, the first tag of every field wins.
+    '''
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.fields: dict[str, str] = {}
+        self.done = False
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]):
+        if tag == 'body':
+            # pages without a closing head tag
+            self.done = True
+        elif tag == 'meta' and not self.done:
+            values = dict(attrs)
+            key = values.get('property') or values.get('name')
+            content = values.get('content')
+            if key in OG_FIELDS and content is not None:
+                self.fields.setdefault(key, content)
+
+    def handle_endtag(self, tag: str):
+        if tag == 'head':
+            self.done = True
+
+
+def parse_og(html: bytes | str) -> dict[str, str]:
+    '''
+    Extracts the open graph fields of a complete page
+
+    :param html: The page
+    :type html: bytes | str
+    :return: The found fields as `{field: content}`, missing fields are left out
+    :rtype: dict[str, str]
+    '''
+    if isinstance(html, bytes):
+        html = html.decode('utf-8', errors='replace')
+
+    parser = OgParser()
+    parser.feed(html)
+    return parser.fields
+
+
+async def read_og(chunks: AsyncIterable[bytes]) -> tuple[dict[str, str], int]:
+    '''
+    Extracts the open graph fields while the page is downloaded and stops reading at the end of `<head>`
+
+    :param chunks: The chunks of the page, e.g. `response.content.iter_chunked(8192)`
+    :type chunks: AsyncIterable[bytes]
+    :return: The found fields as `{field: content}` and the amount of bytes, which were read
+    :rtype: tuple[dict[str, str], int]
+    '''
+    parser = OgParser()
+    # utf-8 characters can be split between two chunks
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    read = 0
+
+    async for chunk in chunks:
+        read += len(chunk)
+        parser.feed(decoder.decode(chunk))
+        if parser.done:
+            break
+    else:
+        parser.feed(decoder.decode(b'', final=True))
+
+    return parser.fields, read
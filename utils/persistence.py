@@ -0,0 +1,80 @@
+'''
+Util for writing files atomically in the background
+'''
+
+import asyncio
+import os
+from typing import Awaitable, Callable
+
+import aiofiles
+
+
+async def write_atomic(path: str, text: str):
+    '''
+    Writes a file without truncating it on a crash, by writing a temporary file first and replacing the original
+
+    :param path: The path of the file
+    :type path: str
+    :param text: The new content of the file
+    :type text: str
+    '''
+    tmp_path = f'{path}.tmp'
+    async with aiofiles.open(tmp_path, 'w', encoding='utf-8') as f:
+        await f.write(text)
+        await f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, path)
+
+
+class WriteBehind:
+    '''
+    Collects pending writes and runs them in the background
+
+    Writes for the same key, which are scheduled within `delay` seconds, are coalesced into one write.
+    '''
+
+    def __init__(self, delay: float = 0.5) -> None:
+        self.delay = delay
+        self._dirty: dict[str, Callable[[], Awaitable[None]]] = {}
+        self._task: asyncio.Task | None = None
+        self._lock = asyncio.Lock()
+
+        self.scheduled = 0
+        self.written = 0
+
+    def mark_dirty(self, key: str, write: Callable[[], Awaitable[None]]):
+        '''
+        Schedules a write. If there already is a pending write for the key, it is replaced
+
+        :param key: The key of the write, most of the time it is the path of the file
+        :type key: str
+        :param write: The function, which writes the file
+        :type write: Callable[[], Awaitable[None]]
+        '''
+        self._dirty[key] = write
+        self.scheduled += 1
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._write_later())
+
+    async def _write_later(self):
+        await asyncio.sleep(self.delay)
+        await self.flush()
+
+    async def flush(self):
+        '''Runs all pending writes now'''
+        async with self._lock:
+            while self._dirty:
+                key = next(iter(self._dirty))
+                write = self._dirty.pop(key)
+
+                try:
+                    await write()
+                    self.written += 1
+                except Exception as ex:
+                    print(f'Failed to write {key}: {ex}')
+
+
+# shared by all utils, flushed when the bot shuts down
+writer = WriteBehind()
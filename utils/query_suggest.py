@@ -0,0 +1,159 @@
+'''
+Util for suggesting wiki search queries from earlier successful searches
+'''
+
+import heapq
+import math
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from classes.algolia import AlgoliaResult, AlgoliaResultType
+from utils.scorer import SCORERS
+from utils.text import normalize
+
+# discord rejects longer choices, shorter ones are no useful queries
+MIN_LENGTH = 3
+MAX_LENGTH = 100
+# headers of results are suggested, but less than queries users searched for
+HEADER_WEIGHT = 0.5
+# minimal score of the fuzzy suggestions for misspelled values
+MIN_FUZZY_SCORE = 70
+
+
+@dataclass
+class Suggestion:
+    text: str
+    normalized: str
+    # how often the query was searched successfully, decayed over time
+    weight: float
+    # unix time of the last update of the weight
+    updated: float
+
+
+class QuerySuggestions:
+    '''
+    In-memory index of popular and recent queries, which returned results, and the headers of their results
+
+    Suggestions are ranked by a popularity, which halves every `half_life` seconds,
+    so recent queries are preferred. The least recently used suggestions are removed if there are more than `maxsize`.
+    '''
+
+    def __init__(self, maxsize: int = 2000, half_life: float = 86400) -> None:
+        '''
+        :param maxsize: The maximal amount of suggestions, defaults to 2000
+        :type maxsize: int, optional
+        :param half_life: The seconds after which the popularity of a suggestion is halved, defaults to 86400
+        :type half_life: float, optional
+        '''
+        self.maxsize = maxsize
+        self.half_life = half_life
+        self._suggestions: OrderedDict[str, Suggestion] = OrderedDict()
+        # sorted keys for prefix searches
+        self._keys: list[str] = []
+
+        self.recorded = 0
+        self.completions = 0
+
+    def __len__(self) -> int:
+        return len(self._suggestions)
+
+    def _score(self, suggestion: Suggestion, now: float) -> float:
+        return suggestion.weight * math.pow(
+            0.5, (now - suggestion.updated) / self.half_life)
+
+    def _add(self, text: str, weight: float, now: float):
+        text = ' '.join(text.split())
+        key = text.casefold()
+        if not MIN_LENGTH <= len(text) <= MAX_LENGTH:
+            return
+
+        suggestion = self._suggestions.get(key)
+        if suggestion is None:
+            self._suggestions[key] = Suggestion(text, normalize(text), weight,
+                                                now)
+            insort(self._keys, key)
+        else:
+            suggestion.weight = self._score(suggestion, now) + weight
+            suggestion.updated = now
+            self._suggestions.move_to_end(key)
+
+        while len(self._suggestions) > self.maxsize:
+            old, _ = self._suggestions.popitem(last=False)
+            del self._keys[bisect_left(self._keys, old)]
+
+    def record(self, query: str, results: list[AlgoliaResult]):
+        '''
+        Adds a successful search, queries without results are ignored
+
+        :param query: The query the user searched for
+        :type query: str
+        :param results: The results of the search
+        :type results: list[AlgoliaResult]
+        '''
+        if not results:
+            return
+
+        now = time.time()
+        self.recorded += 1
+        self._add(query, 1, now)
+
+        # content results are sentences, only headers are useful queries
+        for result in results:
+            if result.type != AlgoliaResultType.content:
+                header = result.header.replace('***__', '').replace(
+                    '__***', '').strip('. ')
+                self._add(header, HEADER_WEIGHT, now)
+
+    def suggest(self, value: str, limit: int = 25) -> list[str]:
+        '''
+        Gets the suggestions for the value the user typed
+
+        Suggestions starting with the value come first, then suggestions containing all words of the value
+        and at last similar suggestions for misspelled values. Every group is ranked by popularity.
+
+        :param value: The value the user typed
+        :type value: str
+        :param limit: The maximal amount of suggestions, defaults to 25
+        :type limit: int, optional
+        :return: The suggestions
+        :rtype: list[str]
+        '''
+        self.completions += 1
+        now = time.time()
+        prefix = ' '.join(value.casefold().split())
+
+        def best(keys: list[str], amount: int) -> list[str]:
+            return heapq.nlargest(
+                amount,
+                keys,
+                key=lambda k: self._score(self._suggestions[k], now))
+
+        # all keys with the prefix follow each other in the sorted list
+        matches: list[str] = []
+        for i in range(bisect_left(self._keys, prefix), len(self._keys)):
+            if not self._keys[i].startswith(prefix):
+                break
+            matches.append(self._keys[i])
+        out = best(matches, limit)
+
+        if len(out) < limit and prefix:
+            found = set(out)
+            words = prefix.split()
+            matches = [
+                k for k in self._suggestions
+                if k not in found and all(w in k for w in words)
+            ]
+            out += best(matches, limit - len(out))
+
+        if len(out) < limit and (query := normalize(value)):
+            found = set(out)
+            res = SCORERS['rapidfuzz'].extract(
+                query, {
+                    k: s.normalized
+                    for k, s in self._suggestions.items() if k not in found
+                }, limit - len(out))
+            out += [k for k, score in res if score >= MIN_FUZZY_SCORE]
+
+        return [self._suggestions[k].text for k in out]
@@ -0,0 +1,136 @@
+'''
+Util for scoring a normalized query against many normalized texts with interchangeable backends
+'''
+
+import heapq
+from abc import ABC, abstractmethod
+from functools import partial
+from typing import Hashable, Iterable, Iterator, Mapping, TypeVar
+
+import numpy as np
+from rapidfuzz import fuzz as rapid_fuzz
+from rapidfuzz import process as rapid_process
+from thefuzz import fuzz, process
+
+K = TypeVar('K', bound=Hashable)
+
+
+class Scorer(ABC):
+    '''
+    Scores a query against texts with WRatio. The query and the texts have to be normalized already
+
+    All backends return `(key, score)` pairs with the best score first. Scores are rounded to integers like thefuzz
+    and ties keep the order of the choices, so the cutoffs of the callers mean the same for every backend.
+    thefuzz also rounds the partial ratios inside WRatio, so its scores can still differ by about one point.
+    '''
+    name = ''
+
+    @abstractmethod
+    def extract(self, query: str, choices: Mapping[K, str],
+                limit: int) -> list[tuple[K, float]]:
+        '''
+        Scores the query against every choice
+
+        :param query: The normalized query
+        :type query: str
+        :param choices: The normalized texts as `{key: text}`
+        :type choices: Mapping[K, str]
+        :param limit: The maximum amount of results
+        :type limit: int
+        :return: The best choices as `(key, score)`, scores are integers between 0 and 100
+        :rtype: list[tuple[K, float]]
+        '''
+
+    def extract_cascade(self, query: str, tiers: Iterable[Mapping[K, str]],
+                        limit: int) -> Iterator[list[tuple[K, float]]]:
+        '''
+        Scores the query against the choices of every tier (e.g. tags, titles and descriptions) in one call
+
+        By default the tiers are scored one after another, when the result of the previous tier was consumed,
+        so a cascade can stop early. Batch backends score all tiers at once instead.
+
+        :param query: The normalized query
+        :type query: str
+        :param tiers: The normalized texts of every tier as `{key: text}`
+        :type tiers: Iterable[Mapping[K, str]]
+        :param limit: The maximum amount of results per tier
+        :type limit: int
+        :return: The best choices of every tier as `(key, score)`, in the order of `tiers`
+        :rtype: Iterator[list[tuple[K, float]]]
+        '''
+        return (self.extract(query, choices, limit) for choices in tiers)
+
+
+class ThefuzzScorer(Scorer):
+    '''Scores every choice with thefuzz, one Python call per choice'''
+    name = 'thefuzz'
+
+    _scorer = partial(fuzz.WRatio, full_process=False)
+
+    def extract(self, query: str, choices: Mapping[K, str],
+                limit: int) -> list[tuple[K, float]]:
+        res = process.extract(
+            query,
+            choices,
+            processor=None,  # type: ignore
+            scorer=self._scorer,
+            limit=limit,
+        )
+        return [(tag[2], tag[1]) for tag in res]  # type: ignore
+
+
+class RapidfuzzScorer(Scorer):
+    '''Scores all choices of a tier with rapidfuzz, the choices are iterated in C'''
+    name = 'rapidfuzz'
+
+    def extract(self, query: str, choices: Mapping[K, str],
+                limit: int) -> list[tuple[K, float]]:
+        res = rapid_process.extract_iter(
+            query,
+            choices,
+            scorer=rapid_fuzz.WRatio,
+            processor=None,
+        )
+        # nlargest is stable, so ties keep the order of the choices like thefuzz
+        return heapq.nlargest(limit, ((tag[2], round(tag[1])) for tag in res),
+                              key=lambda tag: tag[1])
+
+
+class BatchScorer(Scorer):
+    '''Scores the choices of all tiers with a single rapidfuzz `cdist` call and picks the best ones with numpy'''
+    name = 'batch'
+
+    def extract(self, query: str, choices: Mapping[K, str],
+                limit: int) -> list[tuple[K, float]]:
+        return next(self.extract_cascade(query, (choices, ), limit))
+
+    def extract_cascade(self, query: str, tiers: Iterable[Mapping[K, str]],
+                        limit: int) -> Iterator[list[tuple[K, float]]]:
+        all_choices = list(tiers)
+        keys = [list(choices.keys()) for choices in all_choices]
+        texts = [text for choices in all_choices for text in choices.values()]
+        scores = rapid_process.cdist(
+            [query],
+            texts,
+            scorer=rapid_fuzz.WRatio,
+            processor=None,
+        )[0]
+
+        out: list[list[tuple[K, float]]] = []
+        start = 0
+        for tier_keys in keys:
+            # rounded half to even like thefuzz
+            tier = np.round(scores[start:start + len(tier_keys)])
+            start += len(tier_keys)
+
+            # stable, so ties keep the order of the choices like thefuzz
+            best = np.argsort(-tier, kind='stable')[:limit]
+            out.append([(tier_keys[i], int(tier[i])) for i in best])
+
+        return iter(out)
+
+
+SCORERS: dict[str, Scorer] = {
+    scorer.name: scorer
+    for scorer in (ThefuzzScorer(), RapidfuzzScorer(), BatchScorer())
+}
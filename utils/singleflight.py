@@ -0,0 +1,57 @@
+'''
+Util for sharing one in-flight call between concurrent callers with the same key
+'''
+
+import asyncio
+from typing import Awaitable, Callable, Generic, Hashable, TypeVar
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+
+class SingleFlight(Generic[K, V]):
+    '''
+    Coalesces concurrent calls with the same key into one task
+
+    Every caller gets the result or the exception of the shared task. The task is shielded,
+    so a caller, which is cancelled, does not cancel the task for the other callers.
+    '''
+
+    def __init__(self) -> None:
+        self._tasks: dict[K, asyncio.Task[V]] = {}
+
+        self.calls = 0
+        self.shared = 0
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    async def do(self, key: K, func: Callable[[], Awaitable[V]]) -> V:
+        '''
+        Runs `func` or waits for the call, which is already running for the key
+
+        :param key: The key of the call, e.g. the url of a request
+        :type key: K
+        :param func: The function, which is only called if there is no running call for the key
+        :type func: Callable[[], Awaitable[V]]
+        :return: The result of the shared call
+        :rtype: V
+        '''
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+            self.calls += 1
+        else:
+            self.shared += 1
+
+        return await asyncio.shield(task)
+
+    def _done(self, key: K, task: asyncio.Task[V]):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+
+        # if every caller was cancelled, nobody retrieves the exception
+        if not task.cancelled():
+            task.exception()
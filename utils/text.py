@@ -0,0 +1,20 @@
+'''
+Util for normalizing text the same way thefuzz does before scoring
+'''
+
+from thefuzz.utils import full_process
+
+
+def normalize(text: str | None) -> str:
+    '''
+    Normalize a text like the default thefuzz processor does (lowercase, strip, only alphanumeric characters)
+
+    :param text: The text to normalize
+    :type text: str | None
+    :return: The normalized text, an empty string if `text` is None
+    :rtype: str
+    '''
+    if not text:
+        return ''
+
+    return full_process(text, force_ascii=True)
@@ -0,0 +1,257 @@
+'''
+Util for searching a local copy of the algolia wiki index
+'''
+
+import asyncio
+import json
+import os
+import time
+from dataclasses import asdict
+
+import aiofiles
+import numpy as np
+from dataclass_wizard import fromlist
+
+from classes.algolia import AlgoliaResult, AlgoliaResultType, WikiRecord
+from utils.bm25 import Bm25Index
+from utils.persistence import write_atomic, writer
+from utils.text import normalize
+
+# the record types, which are returned by the search, and how much they are preferred
+TYPE_WEIGHTS = {'lvl1': 1.2, 'lvl2': 1.1, 'content': 1.0}
+RESULT_TYPES = {
+    'lvl1': AlgoliaResultType.mainHeader,
+    'lvl2': AlgoliaResultType.subHeader,
+    'content': AlgoliaResultType.content,
+}
+# words, which are in almost every record, a record is not found by them alone
+STOP_WORDS = frozenset(
+    ('a an and are as at be by can do does for from how i if in is it my of on or so that the this to '
+     'what when where which why with you your').split())
+# the share of the words of a query, which a record needs to contain to be returned
+MIN_MATCHED_SHARE = 1.0
+# same format as the algolia snippets
+SNIPPET_WORDS = 10
+HIGHLIGHT = '***__{}__***'
+
+
+def record_from_hit(hit: dict) -> WikiRecord | None:
+    '''
+    Converts a record of the algolia browse api
+
+    :param hit: The record
+    :type hit: dict
+    :return: The record or None if its type is never returned by the search
+    :rtype: WikiRecord | None
+    '''
+    if hit.get('type') not in TYPE_WEIGHTS:
+        return None
+
+    hierarchy = hit.get('hierarchy') or {}
+    return WikiRecord(
+        type=hit['type'],
+        url=hit['url'],
+        lvl0=hierarchy.get('lvl0'),
+        lvl1=hierarchy.get('lvl1'),
+        lvl2=hierarchy.get('lvl2'),
+        content=hit.get('content'),
+    )
+
+
+def snippet(text: str, terms: set[str]) -> tuple[str, list[str]]:
+    '''
+    Shortens a text around the first matched word and highlights the matched words like algolia
+
+    :param text: The text
+    :type text: str
+    :param terms: The normalized words of the query
+    :type terms: set[str]
+    :return: The snippet and the matched words
+    :rtype: tuple[str, list[str]]
+    '''
+    words = text.split()
+    matched = [normalize(w) in terms for w in words]
+
+    start = 0
+    if len(words) > SNIPPET_WORDS and any(matched):
+        start = min(matched.index(True), len(words) - SNIPPET_WORDS)
+    end = start + SNIPPET_WORDS
+
+    out = ' '.join(
+        HIGHLIGHT.format(w) if m else w
+        for w, m in zip(words[start:end], matched[start:end]))
+    if start > 0:
+        out = f'...{out}'
+    if end < len(words):
+        out = f'{out}...'
+
+    highlight = sorted({normalize(w) for w, m in zip(words, matched) if m})
+    return out, highlight
+
+
+class WikiMirror:
+    '''
+    Local copy of the algolia index, which is searched with bm25
+
+    The records are synced by `AlgoliaUtil.sync_mirror` and stored in a file, so they survive restarts.
+    '''
+
+    def __init__(self,
+                 path: str,
+                 records: list[WikiRecord],
+                 synced: float = 0,
+                 max_age: float = 86400) -> None:
+        '''
+        :param path: The path of the mirror file
+        :type path: str
+        :param records: The records
+        :type records: list[WikiRecord]
+        :param synced: The unix time of the last sync, defaults to 0
+        :type synced: float, optional
+        :param max_age: The seconds after a sync, in which the mirror is searched before algolia, defaults to 86400
+        :type max_age: float, optional
+        '''
+        self.path = path
+        self.synced = synced
+        self.max_age = max_age
+        self._set_records(records)
+
+        self.searches = 0
+        self.syncs = 0
+
+    @classmethod
+    async def create(cls, path: str, max_age: float = 86400) -> 'WikiMirror':
+        '''
+        Creates the mirror and loads the records from the file, if it exists
+
+        :param path: The path of the mirror file
+        :type path: str
+        :param max_age: The seconds after a sync, in which the mirror is searched before algolia, defaults to 86400
+        :type max_age: float, optional
+        :return: The mirror
+        :rtype: WikiMirror
+        '''
+        records: list[WikiRecord] = []
+        synced = 0
+        if os.path.exists(path):
+            try:
+                async with aiofiles.open(path, 'r', encoding='utf-8') as f:
+                    data = json.loads(await f.read())
+                records = fromlist(WikiRecord, data['records'])
+                synced = data['synced']
+            except Exception as ex:
+                # the mirror is synced again
+                print(f'Failed to load the wiki mirror {path}: {ex}')
+                records = []
+
+        # the index is built in a thread, so the bot is not blocked by large mirrors
+        return await asyncio.to_thread(cls, path, records, synced, max_age)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    @property
+    def age(self) -> float:
+        '''The seconds since the last sync'''
+        return time.time() - self.synced
+
+    def is_fresh(self) -> bool:
+        '''
+        Checks if the mirror should be searched before algolia
+
+        :return: True if there are records and the last sync is less than `max_age` seconds ago
+        :rtype: bool
+        '''
+        return len(self._records) > 0 and self.age < self.max_age
+
+    def _set_records(self, records: list[WikiRecord]):
+        index = Bm25Index({
+            str(i): normalize(' '.join(
+                t for t in (r.lvl0, r.lvl1, r.lvl2, r.content) if t)).split()
+            for i, r in enumerate(records)
+        })
+        weights = np.array([TYPE_WEIGHTS[r.type] for r in records],
+                           dtype=np.float64)
+
+        # replaced at once, so running searches see either the old or the new records
+        self._records, self._index, self._weights = records, index, weights
+
+    async def update(self, records: list[WikiRecord]):
+        '''
+        Replaces all records after a sync and saves them in the background
+
+        :param records: The new records
+        :type records: list[WikiRecord]
+        '''
+        await asyncio.to_thread(self._set_records, records)
+        self.synced = time.time()
+        self.syncs += 1
+        writer.mark_dirty(self.path, self.save)
+
+    async def save(self):
+        '''Writes all records to the mirror file'''
+        # the file is only read by the bot, so it is written without indentation
+        await write_atomic(
+            self.path,
+            json.dumps({
+                'synced': self.synced,
+                'records': [asdict(r) for r in self._records],
+            }))
+
+    def search(self,
+               query: str,
+               max: int = 5,
+               min_share: float = MIN_MATCHED_SHARE) -> list[AlgoliaResult]:
+        '''
+        Searches the records in the same format as `AlgoliaUtil.search_query`
+
+        Stop words are ignored, so they do not make every record a result.
+
+        :param query: The query to search for
+        :type query: str
+        :param max: The maximum amount of results, defaults to 5
+        :type max: int, optional
+        :param min_share: The share of the words of the query (without stop words), which a record needs to contain, defaults to `MIN_MATCHED_SHARE`
+        :type min_share: float, optional
+        :return: The results, empty if no record contains enough words of the query
+        :rtype: list[AlgoliaResult]
+        '''
+        records, index, weights = self._records, self._index, self._weights
+        terms = set(normalize(query).split()) - STOP_WORDS
+        if not records or not terms:
+            return []
+
+        self.searches += 1
+        query = ' '.join(terms)
+        scores = index.scores(query) * weights
+        # records with too few words of the query are left out
+        scores[index.matched_terms(query) < min_share * len(terms)] = 0
+        best = np.argsort(-scores, kind='stable')[:max]
+
+        out: list[AlgoliaResult] = []
+        for i in best:
+            if scores[i] <= 0:
+                break
+
+            record = records[i]
+            if record.type == 'lvl1':
+                header, description = record.lvl1, None
+            elif record.type == 'lvl2':
+                header, description = record.lvl2, record.lvl1
+            else:
+                header, description = record.content, record.lvl1
+
+            header, highlight = snippet(header or '', terms)
+            if description is not None:
+                description = snippet(description, terms)[0]
+
+            out.append(
+                AlgoliaResult(
+                    header=header,
+                    description=description,
+                    highlight=highlight,
+                    url=record.url,
+                    type=RESULT_TYPES[record.type],
+                ))
+
+        return out